@@ -4,6 +4,7 @@ import os
 import sys
 import time
 from argparse import ArgumentParser
+from configparser import ConfigParser
 from pathvalidate.argparse import validate_filepath_arg
 
 import PyQt5
@@ -19,6 +20,7 @@ from viewer.scroll_viewer import *
 from viewer.joystick_viewer import *
 
 from util.qt_vna import *
+from util.qt_state_events import QtStateEvents
 
 import qdarktheme
 
@@ -33,6 +35,10 @@ class MainWindow(QMainWindow):
         parser = ArgumentParser()
         parser.add_argument("-i", "--inipath", type=validate_filepath_arg)
         parser.add_argument("-f", "--logpath", type=validate_filepath_arg)
+        parser.add_argument("-s", "--start-frame", type=int, default=0,
+                            help="replay the log from this frame")
+        parser.add_argument("-m", "--replay-mode", default='realtime',
+                            help="replay pace: realtime, fast or Nx (N times real time)")
         parser.add_argument("-d", "--dark", help="dark mode",
                             action="store_true")
         options = parser.parse_args()
@@ -55,14 +61,19 @@ class MainWindow(QMainWindow):
 
         self.tabs = QTabWidget()
         self.tabs.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        self.vna = QtVNA(self, inifile=_inifile, logfile=_logfile)
-        self.graph_viewer = GraphViewer(self)
+        self.vna = QtVNA(self, inifile=_inifile, logfile=_logfile,
+                         log_start=options.start_frame, replay_mode=options.replay_mode)
+        self.graph_viewer = GraphViewer(self, inifile=_inifile)
         self.sensor_viewer = SensorViewer(
             self, inifile=_inifile, dark_mode=options.dark)
         self.switch_viewer = SwitchViewer(self)
         self.scroll_viewer = ScrollViewer(self, inifile=_inifile)
         self.slider_viewer = SliderViewer(self, inifile=_inifile)
         self.joystick_viewer = JoystickViewer(self, inifile=_inifile)
+        # debounced sensor events for the application viewers
+        parser = ConfigParser()
+        parser.read(_inifile)
+        self.state_events = QtStateEvents.from_parser(parser, parent=self)
         self.tabs.addTab(self.vna, "VNA setup")
         self.tabs.addTab(self.graph_viewer, "S21 Graph")
         self.tabs.addTab(self.sensor_viewer, "Sensor status")
@@ -122,6 +133,12 @@ class MainWindow(QMainWindow):
         except TypeError as e:
             pass
 
+        try:
+            self.state_events.event_signal.disconnect()
+        except TypeError as e:
+            pass
+        self.state_events.reset()
+
         self.sensor_viewer.stopViewer()
         self.switch_viewer.pause()
         self.slider_viewer.pause()
@@ -140,19 +157,23 @@ class MainWindow(QMainWindow):
         self.vna.peak_signal.connect(
             self.sensor_viewer.updateSensorState)
 
-        if id == 3:
+        if id >= 3:
             self.sensor_viewer.sensor_info_signal.connect(
-                self.switch_viewer.updateMusicState)
+                self.state_events.update)
+
+        if id == 3:
+            self.state_events.event_signal.connect(
+                self.switch_viewer.onStateEvent)
         elif id == 4:
-            self.sensor_viewer.sensor_info_signal.connect(
-                self.slider_viewer.updateVideoState)
+            self.state_events.event_signal.connect(
+                self.slider_viewer.onStateEvent)
         elif id == 5:
-            self.sensor_viewer.sensor_info_signal.connect(
-                self.scroll_viewer.updatePaperPos)
+            self.state_events.event_signal.connect(
+                self.scroll_viewer.onStateEvent)
             self.scroll_viewer.start()
         elif id == 6:
-            self.sensor_viewer.sensor_info_signal.connect(
-                self.joystick_viewer.updateJoystickState)
+            self.state_events.event_signal.connect(
+                self.joystick_viewer.onStateEvent)
             # self.sensor_viewer.sensor_info_signal.connect(
             #    self.joystick_viewer.updateJoystickFig)
 
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import time
+
+from util.acquisition import AcquisitionWorker, FrameMailbox
+
+
+def _run(worker, seconds):
+    worker.start()
+    time.sleep(seconds)
+    worker.stop(timeout=2.0)
+    assert not worker.is_alive()
+
+
+def test_persistent_failure_prints_one_traceback_and_backs_off(capsys):
+    def acquire():
+        raise IOError('serial port gone')
+
+    worker = AcquisitionWorker(acquire, FrameMailbox(), error_wait=0.01, max_error_wait=0.08)
+    _run(worker, 0.5)
+    err = capsys.readouterr().err
+    assert err.count('Traceback') == 1
+    # 0.01 + 0.02 + 0.04, then every 0.08 s: far fewer than 50 tries of 0.01 s
+    assert 4 <= worker.errors <= 15
+    assert 'acquire failed {} more times with OSError'.format(worker.errors - 1) in err
+
+
+def test_recovery_resets_the_wait_and_reports_the_repeats(capsys):
+    calls = []
+
+    def acquire():
+        calls.append(time.time())
+        if len(calls) <= 3:
+            raise ValueError('short read')
+        return len(calls)
+
+    mailbox = FrameMailbox()
+    worker = AcquisitionWorker(acquire, mailbox, interval=0.01, error_wait=0.05)
+    _run(worker, 0.5)
+    err = capsys.readouterr().err
+    assert err.count('Traceback') == 1
+    assert err.count('acquire failed 2 more times') == 1
+    assert worker.errors == 3
+    # back to the interval once acquire works again
+    assert mailbox.posted > 10
+
+
+def test_a_different_error_gets_its_own_traceback(capsys):
+    errors = [IOError('timeout'), IOError('timeout'), ValueError('bad block')]
+
+    def acquire():
+        if errors:
+            raise errors.pop(0)
+
+    worker = AcquisitionWorker(acquire, FrameMailbox(), error_wait=0.01)
+    _run(worker, 0.2)
+    err = capsys.readouterr().err
+    assert err.count('Traceback') == 2
+    assert err.count('acquire failed 1 more times') == 1
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pytest
+
+from util.capture import encode_delta, decode_delta, CaptureWriter, CaptureReader, FRAME_DTYPE
+
+SAMPLE_LOG = os.path.join(os.path.dirname(__file__), '..', 'sample_log',
+                          's21_press_ring.npy')
+
+
+@pytest.fixture(scope='module')
+def log():
+    return np.load(SAMPLE_LOG)
+
+
+def _table(n, start=0):
+    table = np.zeros(n, dtype=FRAME_DTYPE)
+    table['time'] = np.arange(start, start + n) * 0.01
+    table['thres'] = 0.03
+    table['peak_freq'] = np.nan
+    return table
+
+
+def _write(path, freq, frames, chunk=16, **kwargs):
+    writer = CaptureWriter(path, freq, attrs={'step_num': len(freq)}, **kwargs)
+    for start in range(0, len(frames), chunk):
+        rows = frames[start:start + chunk]
+        writer.write(rows, _table(len(rows), start))
+    return writer
+
+
+@pytest.mark.parametrize('resolution', [0.01, 0.001, 0.0001])
+def test_decode_delta_is_within_half_a_step(log, resolution):
+    rows = log[1:]
+    encoded = encode_delta(rows, resolution)
+    assert encoded is not None
+    decoded = decode_delta(*encoded, resolution)
+    assert decoded.shape == rows.shape
+    assert np.abs(decoded - rows).max() <= resolution / 2 + 1e-9
+
+
+def test_encode_delta_refuses_what_it_cannot_store():
+    rows = np.zeros((3, 4))
+    rows[1, 2] = np.nan
+    assert encode_delta(rows) is None
+    # a change of 40 dB is 40000 steps of 0.001 dB, more than int16 holds
+    assert encode_delta(np.array([[0.0, 0.0], [40.0, 0.0]]), 0.001) is None
+
+
+def test_raw_capture_round_trip(log, tmp_path):
+    freq, frames = log[0], log[1:]
+    path = str(tmp_path / 'raw.npz')
+    _write(path, freq, frames).close()
+
+    reader = CaptureReader(path)
+    assert reader.frames == len(frames)
+    assert reader.attrs == {'step_num': len(freq)}
+    assert np.array_equal(reader.freq, freq)
+    assert np.array_equal(np.array([reader.row(i) for i in range(reader.frames)]), frames)
+    table = reader.table()
+    assert table.dtype == FRAME_DTYPE
+    assert np.array_equal(table['time'], _table(len(frames))['time'])
+    assert np.isnan(table['peak_freq']).all()
+    with pytest.raises(IndexError):
+        reader.row(reader.frames)
+    reader.close()
+
+    # a closed capture is a plain npz
+    with np.load(path) as npz:
+        assert np.array_equal(npz['freq'], freq)
+
+
+@pytest.mark.parametrize('resolution', [0.01, 0.001])
+def test_delta_capture_round_trip(log, tmp_path, resolution):
+    freq, frames = log[0], log[1:]
+    path = str(tmp_path / 'delta.npz')
+    _write(path, freq, frames, encoding='delta', resolution=resolution).close()
+
+    reader = CaptureReader(path)
+    assert reader.encoding == {'frames': 'delta', 'resolution': resolution}
+    assert reader.frames == len(frames)
+    rows = np.array([reader.row(i) for i in range(reader.frames)])
+    assert np.abs(rows - frames).max() <= resolution / 2 + 1e-9
+    assert reader.time(len(frames) - 1) == pytest.approx((len(frames) - 1) * 0.01)
+    reader.close()
+
+
+def test_capture_being_recorded_opens(log, tmp_path):
+    freq, frames = log[0], log[1:]
+    path = str(tmp_path / 'open.npz')
+    writer = _write(path, freq, frames[:40])
+    # no central directory yet: the chunks written so far are read
+    reader = CaptureReader(path)
+    assert reader.frames == 40
+    assert np.array_equal(reader.row(39), frames[39])
+    reader.close()
+    writer.close()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from util.nanovna import NanoVNA, parse_complex_block, parse_float_block, parse_hex_block
+from util.fake_nanovna import FakeNanoVNASerial
+
+
+# the list-based parsers NanoVNA used before the block parsers; golden output
+def _list_parse_complex(data):
+    x = []
+    for line in data.split('\n'):
+        if line:
+            d = line.strip().split(' ')
+            x.append(float(d[0])+float(d[1])*1.j)
+    return np.array(x)
+
+
+def _list_parse_float(data):
+    x = []
+    for line in data.split('\n'):
+        if line:
+            x.append(float(line))
+    return np.array(x)
+
+
+def _list_parse_hex(data):
+    x = []
+    for line in data.split('\n'):
+        if line:
+            x.extend([int(d, 16) for d in line.strip().split(' ')])
+    return np.array(x).astype(np.int16)
+
+
+def _fake_vna(points):
+    vna = NanoVNA(dev='fake')
+    vna.serial = FakeNanoVNASerial(points=points)
+    return vna
+
+
+def _response(vna, cmd):
+    vna.send_command(cmd)
+    return vna.fetch_data()
+
+
+@pytest.mark.parametrize('points', [101, 401, 1601])
+def test_complex_block_matches_list_parser(points):
+    text = _response(_fake_vna(points), "data 1\r")
+    parsed = parse_complex_block(text)
+    assert parsed.dtype == np.complex128
+    assert np.array_equal(parsed, _list_parse_complex(text))
+
+
+@pytest.mark.parametrize('points', [101, 401, 1601])
+def test_float_block_matches_list_parser(points):
+    text = _response(_fake_vna(points), "frequencies\r")
+    assert np.array_equal(parse_float_block(text), _list_parse_float(text))
+
+
+@pytest.mark.parametrize('points', [101, 401, 1601])
+def test_hex_block_matches_list_parser(points):
+    text = _response(_fake_vna(points), "dump 0\r") * (points // 96 + 1)
+    parsed = parse_hex_block(text)
+    assert parsed.dtype == np.int16
+    assert np.array_equal(parsed, _list_parse_hex(text))
+
+
+def test_blocks_of_handwritten_responses():
+    assert np.array_equal(parse_complex_block('1.5 -2.25\r\n-0.000001 3e-3\r\n'),
+                          _list_parse_complex('1.5 -2.25\r\n-0.000001 3e-3\r\n'))
+    assert np.array_equal(parse_float_block('27000000\n30000000\n'),
+                          _list_parse_float('27000000\n30000000\n'))
+    # dump prints every sample as unsigned %04x; values above 7fff wrap to
+    # negative int16 like the list parser's astype
+    text = '7fff 8000 ffff 0000\r\n1a2b 00ff\n'
+    assert np.array_equal(parse_hex_block(text), _list_parse_hex(text))
+    assert len(parse_complex_block('')) == 0
+    assert len(parse_hex_block('')) == 0
+
+
+def test_driver_reads_sweep_and_axis():
+    vna = _fake_vna(101)
+    assert np.array_equal(vna.fetch_frequencies(), vna.serial.frequencies())
+    text = _response(_fake_vna(101), "data 1\r")
+    assert np.array_equal(vna.data(1), _list_parse_complex(text))
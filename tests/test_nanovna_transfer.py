@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from util.nanovna import NanoVNA
+from util.fake_nanovna import FakeNanoVNASerial
+
+
+def _fake_vna(points):
+    vna = NanoVNA(dev='fake')
+    vna.serial = FakeNanoVNASerial(points=points)
+    return vna
+
+
+# the byte-at-a-time reader fetch_data replaced; golden output
+def _bytewise_fetch_data(serial):
+    result = ''
+    line = ''
+    while True:
+        c = serial.read().decode('utf-8')
+        line += c
+        if c == chr(10):
+            result += line
+            line = ''
+        if line.endswith('ch>'):
+            break
+    return result
+
+
+@pytest.mark.parametrize('command', ["data 1\r", "frequencies\r", "dump 0\r"])
+@pytest.mark.parametrize('points', [101, 401, 1601])
+def test_fetch_data_matches_bytewise_reader(points, command):
+    serial = FakeNanoVNASerial(points=points)
+    vna = _fake_vna(points)
+    for _ in range(3):
+        serial.write(command.encode())
+        serial.readline()
+        vna.send_command(command)
+        assert vna.fetch_data() == _bytewise_fetch_data(serial)
+
+
+@pytest.mark.parametrize('points', [101, 401, 1601])
+def test_binary_scan_matches_ascii_sweep(points):
+    vna = _fake_vna(points)
+    start, stop = vna.serial.start, vna.serial.stop
+    vna.serial.sweep_cnt = 0
+    s21_ascii = vna.data(1)
+    assert np.array_equal(vna.fetch_frequencies(force=True), vna.serial.frequencies())
+    vna.serial.sweep_cnt = 0
+    scan = vna.scan_binary(start, stop, points)
+    # ascii carries 6 decimals, binary carries float32
+    assert np.allclose(s21_ascii, scan['s21'], atol=1e-6)
+    assert np.array_equal(vna.frequencies, vna.serial.frequencies())
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pytest
+
+from util.peak_detector import PeakDetector, detect_peak_with_polyfit, detect_peaks_batch
+
+SAMPLE_LOG = os.path.join(os.path.dirname(__file__), '..', 'sample_log',
+                          's21_press_ring.npy')
+
+
+@pytest.fixture(scope='module')
+def log():
+    return np.load(SAMPLE_LOG)
+
+
+def test_batch_matches_per_frame_detection(log):
+    freq, frames = log[0], log[1:]
+    peaks, base_dB, _, _ = detect_peaks_batch(deg=4, thres=0.03, Y=frames, x=freq)
+    rows = [detect_peak_with_polyfit(deg=4, thres=0.03, y=y, x=freq) for y in frames]
+    assert len(peaks) == len(rows)
+    for row, p in zip(rows, peaks):
+        assert np.array_equal(row[0], p)
+    assert np.allclose(np.array([row[1] for row in rows]), base_dB, atol=1e-6)
+
+
+@pytest.mark.parametrize('points', [51, 101, 401, 1601])
+def test_detector_matches_detect_peak_with_polyfit(log, points):
+    x = np.linspace(27, 30, points)
+    detector = PeakDetector(deg=4)
+    for row in log[1::10]:
+        y = np.interp(x, log[0], row)
+        result = detector.detect(0.03, y, x)
+        reference = detect_peak_with_polyfit(4, 0.03, y, x)
+        assert np.array_equal(result[0], reference[0])
+        for a, b in zip(result[1:], reference[1:]):
+            assert np.allclose(a, b, atol=1e-6)
+        # the pooled buffers are reused by the next frame
+        detector.release(result[1])
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pytest
+
+from util.peak_detector import PolyBaseline, detect_peak_with_polyfit
+
+SAMPLE_LOG = os.path.join(os.path.dirname(__file__), '..', 'sample_log',
+                          's21_press_ring.npy')
+
+
+@pytest.fixture(scope='module')
+def log():
+    return np.load(SAMPLE_LOG)
+
+
+def _polyfit(y, x, deg=4):
+    return np.poly1d(np.polyfit(x, y, deg))(x)
+
+
+@pytest.mark.parametrize('points', [51, 101, 401, 1601])
+def test_fit_matches_polyfit(log, points):
+    x = np.linspace(27, 30, points)
+    baseline = PolyBaseline(4)
+    for row in log[1::10]:
+        y = np.interp(x, log[0], row)
+        assert np.max(np.abs(baseline.fit(y, x) - _polyfit(y, x))) < 1e-6
+
+
+def test_fit_of_a_stack_matches_polyfit_per_row(log):
+    freq, frames = log[0], log[1:]
+    fitted = PolyBaseline(4).fit(frames, freq)
+    reference = np.array([_polyfit(y, freq) for y in frames])
+    assert np.max(np.abs(fitted - reference)) < 1e-6
+
+
+def test_detect_peak_with_cached_baseline_matches_polyfit(log):
+    freq = log[0]
+    baseline = PolyBaseline(4)
+    for y in log[1:]:
+        cached = detect_peak_with_polyfit(4, 0.03, y, freq, baseline=baseline)
+        reference = detect_peak_with_polyfit(4, 0.03, y, freq)
+        assert np.array_equal(cached[0], reference[0])
+        for a, b in zip(cached[1:], reference[1:]):
+            assert np.allclose(a, b, atol=1e-6)
+
+
+def test_windows_are_cached_and_invalidated(log):
+    y = log[len(log) // 2]
+    baseline = PolyBaseline(4, max_windows=2)
+    baseline.fit(y, log[0])
+    baseline.fit(y[5:40], log[0][5:40])
+    assert len(baseline._windows) == 2
+    # a third window evicts the least recently used one
+    baseline.fit(y, log[0])
+    baseline.fit(y[10:30], log[0][10:30])
+    assert len(baseline._windows) == 2
+    assert (len(log[0]), float(log[0][0]), float(log[0][-1])) in baseline._windows
+
+    # setFreqRange drops the prepared windows; the next fit is still exact
+    baseline.invalidate()
+    assert len(baseline._windows) == 0
+    x, y = log[0][10:30], y[10:30]
+    assert np.max(np.abs(baseline.fit(y, x) - _polyfit(y, x))) < 1e-6
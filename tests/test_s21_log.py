@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import time
+
+import numpy as np
+import pytest
+
+from util.s21_log import S21Recorder, open_log
+
+
+def _frames(n=150, points=51):
+    freq = np.linspace(27, 30, points)
+    return freq, np.random.default_rng(0).normal(-20, 1, (n, points))
+
+
+@pytest.mark.parametrize('name', ['log.npy', 'log.npz'])
+def test_recorder_round_trip(tmp_path, name):
+    freq, dB = _frames()
+    recorder = S21Recorder(str(tmp_path / name), freq, chunk=16, interval=0.01)
+    recorder.start()
+    for i, row in enumerate(dB):
+        recorder.put(freq, row, i * 0.01)
+    # a sweep on another axis does not fit the log
+    recorder.put(freq[:10], dB[0][:10], 0.0)
+    assert recorder.close(timeout=5.0)
+    assert (recorder.frames, recorder.dropped, recorder.skipped) == (len(dB), 0, 1)
+
+    log = open_log(recorder.path)
+    assert log.frames == len(dB)
+    assert np.array_equal(log.freq, freq)
+    assert np.array_equal(np.array([log.row(i) for i in range(log.frames)]), dB)
+    assert log.time(len(dB) - 1) == pytest.approx((len(dB) - 1) * 0.01)
+    log.close()
+
+
+def test_close_does_not_block_on_a_full_queue(tmp_path):
+    freq, dB = _frames()
+    # the writer would only look at the queue again after a minute
+    recorder = S21Recorder(str(tmp_path / 'log.npz'), freq, queue_size=8, interval=60.0)
+    recorder.start()
+    for i, row in enumerate(dB[:20]):
+        recorder.put(freq, row, i * 0.01)
+    assert recorder.dropped == 12
+
+    st = time.perf_counter()
+    assert recorder.close(timeout=5.0)
+    assert time.perf_counter() - st < 1.0
+    assert recorder.frames == 8
+    # frames put after close are counted, not queued
+    recorder.put(freq, dB[0], 1.0)
+    assert recorder.dropped == 13
+
+
+def test_close_of_a_recorder_never_started(tmp_path):
+    freq, dB = _frames(10)
+    recorder = S21Recorder(str(tmp_path / 'log.npy'), freq, queue_size=4)
+    for i, row in enumerate(dB):
+        recorder.put(freq, row, i * 0.01)
+    assert recorder.close(timeout=0.1)
+    assert (recorder.frames, recorder.dropped) == (4, 6)
+    assert open_log(recorder.path).frames == 4
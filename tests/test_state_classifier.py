@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import os
+from configparser import ConfigParser
+
+import numpy as np
+import pytest
+
+from util.peak_detector import PeakDetector, PeakTracker
+from util.state_classifier import StateClassifier
+from util.helper_func import findNearestID
+
+SAMPLE_INI = os.path.join(os.path.dirname(__file__), '..', 'setting', 'default.ini')
+SENSORS = ['switch', 'slider', 'joystick', 'scroll', 'mouse']
+
+
+def _find_nearest_states(cells, peak):
+    # SensorViewer before the lookup table: every table cell is parsed and
+    # every sensor searched with the nearest listed frequency
+    sensor_info = {}
+    for sensor, (state_list, texts) in cells.items():
+        peak_list = [float(text) for text in texts[:-1]]
+        peak_range = float(texts[-1])
+        id = (np.abs(np.array(peak_list) - peak)).argmin()
+        sensor_info[sensor] = state_list[id] if (
+            np.abs(peak_list[id] - peak) < peak_range/2) else 'none'
+    return sensor_info
+
+
+def _loop_sensor_states(tables, peaks):
+    # per-peak, per-sensor python reference of StateClassifier.sensor_states
+    sensor_info = {}
+    for sensor, (state_list, peak_list, peak_range) in tables.items():
+        best = None
+        for peak in peaks:
+            id = findNearestID(array=peak_list, value=peak)
+            distance = np.abs(peak_list[id] - peak)
+            if distance < peak_range/2 and (best is None or distance < best[0]):
+                best = (distance, state_list[id])
+        sensor_info[sensor] = 'none' if best is None else best[1]
+    return sensor_info
+
+
+@pytest.fixture(scope='module')
+def parser():
+    parser = ConfigParser()
+    parser.read(SAMPLE_INI)
+    return parser
+
+
+def test_no_peaks_is_none_for_every_sensor(parser):
+    classifier = StateClassifier.from_parser(parser, SENSORS)
+    expected = {sensor: 'none' for sensor in SENSORS}
+    assert classifier.sensor_states([]) == expected
+    assert classifier.sensor_states(np.empty(0)) == expected
+
+
+def test_lookup_table_matches_nearest_search(parser):
+    classifier = StateClassifier.from_parser(parser, SENSORS)
+    cells = {sensor: ([key for key in parser[sensor] if key != 'range'],
+                      [parser[sensor][key] for key in parser[sensor] if key != 'range']
+                      + [parser[sensor]['range']])
+             for sensor in SENSORS}
+    # random peaks plus every listed frequency and the points around it,
+    # including exactly half a range away
+    centres = np.concatenate([[float(parser[s][k]) for k in parser[s]] for s in SENSORS])
+    peaks = np.concatenate([np.random.default_rng(0).uniform(26, 30, 2000),
+                            centres, centres + 0.05, centres - 0.1, centres + 0.15])
+    expected = [_find_nearest_states(cells, peak) for peak in peaks]
+    assert [classifier.states(peak) for peak in peaks] == expected
+
+    # classify() is the same lookup as index arrays
+    ids = classifier.classify(peaks)
+    names = [{sensor: classifier.state_lists[k][i] if i >= 0 else 'none'
+              for k, (sensor, i) in enumerate(zip(classifier.sensors, row))} for row in ids]
+    assert names == expected
+
+
+def test_multi_peak_matches_per_peak_loop():
+    # three rings on one reader, two states each, tracked from synthetic sweeps
+    tables = {'ring_{}'.format(i): (['off', 'on'], [27.3 + i, 27.6 + i], 0.2) for i in range(3)}
+    classifier = StateClassifier(tables)
+    rng = np.random.default_rng(0)
+    truth = rng.integers(0, 2, (200, len(tables)))
+    centres = np.array([peak_list for _, peak_list, _ in tables.values()])
+    dips = centres[np.arange(len(tables)), truth] + rng.normal(0, 0.01, truth.shape)
+    x = np.linspace(27, 30, 101)
+    frames_dB = -20 - 0.5 * (x - 27) - np.sum(
+        0.4 / (1 + ((x - dips[:, :, None]) / 0.05)**2), axis=1)
+
+    tracker = PeakTracker(PeakDetector(deg=4, peak_kind='all'))
+    peak_freqs = []
+    for y in frames_dB:
+        result = tracker.track(0.03, y, x)
+        tracker.detector.release(result[1])
+        peak_freqs.append(tracker.peak_freqs.copy())
+    # and peaks that fall between, on and beside the listed frequencies
+    peak_freqs += [np.array([27.45, 28.3, 29.6]), np.array([27.39, 27.41]),
+                   np.array([26.0]), np.array([27.3, 27.6, 28.6, 30.0])]
+
+    for peaks in peak_freqs:
+        assert classifier.sensor_states(peaks) == _loop_sensor_states(tables, peaks)
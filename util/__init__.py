@@ -1,6 +1,18 @@
-from util.qt_vna import *
+import importlib
+
 from util.helper_func import *
-from util.double_slider import *
 from util.peak_detector import *
 from util.nanovna import *
 from util.helper_visa import *
+
+# Qt widgets are imported on first use (util.QtVNA), so the headless modules
+# (util.pipeline, util.replay, util.benchmark) run without PyQt
+_QT_MODULES = ('util.qt_vna', 'util.double_slider')
+
+
+def __getattr__(name):
+    for module in _QT_MODULES:
+        module = importlib.import_module(module)
+        if hasattr(module, name):
+            return getattr(module, name)
+    raise AttributeError("module 'util' has no attribute {!r}".format(name))
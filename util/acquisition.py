@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import threading
+import traceback
+
+import numpy as np
+
+from util.nanovna import parse_complex_block
+
+
+# Single-slot handoff between the acquisition thread and the GUI.
+# The latest frame wins: a frame that was never taken is dropped, not queued.
+class FrameMailbox(object):
+
+    def __init__(self):
+        self._frame = None
+        self._lock = threading.Lock()
+        self.posted = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        # returns the frame that was replaced without being taken, if any
+        with self._lock:
+            replaced, self._frame = self._frame, frame
+            if replaced is not None:
+                self.dropped = self.dropped + 1
+            self.posted = self.posted + 1
+        return replaced
+
+    def take(self):
+        with self._lock:
+            frame, self._frame = self._frame, None
+        return frame
+
+
+# Runs acquire() back-to-back on its own thread and posts every frame to the
+# mailbox. interval (s) paces sources that have no timing of their own;
+# release(frame) is called for frames dropped by the mailbox. An exception
+# in acquire() is counted (errors) and the next frame is tried after
+# error_wait s, as the GUI timer used to retry on its next tick. While
+# acquire() keeps failing the wait doubles up to max_error_wait s, and a
+# traceback is printed only for an error unlike the one before; the repeats
+# are reported as one line once acquire() recovers or the worker stops.
+class AcquisitionWorker(threading.Thread):
+
+    def __init__(self, acquire, mailbox, interval=0.0, release=None, error_wait=0.01,
+                 max_error_wait=1.0):
+        super().__init__(daemon=True)
+        self.acquire = acquire
+        self.mailbox = mailbox
+        self.interval = interval
+        self.release = release
+        self.error_wait = error_wait
+        self.max_error_wait = max_error_wait
+        self.errors = 0
+        self._stop_event = threading.Event()
+
+    def _reportRepeats(self, error, repeats):
+        if repeats:
+            print('acquire failed {} more times with {}'.format(repeats, error), file=sys.stderr)
+
+    def run(self):
+        error, repeats = None, 0
+        error_wait = self.error_wait
+        while not self._stop_event.is_set():
+            st = time.time()
+            try:
+                frame = self.acquire()
+            except Exception as e:
+                self.errors = self.errors + 1
+                if repr(e) == error:
+                    repeats = repeats + 1
+                else:
+                    self._reportRepeats(error, repeats)
+                    traceback.print_exc()
+                    error, repeats = repr(e), 0
+                self._stop_event.wait(error_wait)
+                error_wait = min(error_wait * 2, self.max_error_wait)
+                continue
+            if error is not None:
+                self._reportRepeats(error, repeats)
+                error, repeats = None, 0
+                error_wait = self.error_wait
+            if frame is not None:
+                dropped = self.mailbox.put(frame)
+                if dropped is not None and self.release is not None:
+                    self.release(dropped)
+
+            wait = self.interval - (time.time() - st)
+            if wait > 0:
+                self._stop_event.wait(wait)
+        self._reportRepeats(error, repeats)
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+
+# One S21 sweep from a NanoVNA, split into request / receive / parse.
+# With pipeline=True the next sweep is requested as soon as the current one
+# has been received, so the device measures while the host parses and detects.
+class NanoVNASweeper(object):
+
+    def __init__(self, vna, start, stop, points, transfer='ascii', pipeline=False, scan=False):
+        # scan: drive every ascii sweep with an explicit scan command, needed
+        # when the span changes from sweep to sweep (binary always does)
+        self.vna = vna
+        self.start = start
+        self.stop = stop
+        self.points = points
+        self.transfer = transfer
+        self.pipeline = pipeline
+        self.scan = scan
+        self._in_flight = False
+        self._requested_at = None
+        self._span = None
+        # request time, span (start, stop, points) and frequency axis (Hz)
+        # of the sweep returned by the last sweep() call
+        self.requested_at = None
+        self.span = None
+        self.freq = None
+
+    def retune(self, start, stop, points):
+        # span of the next request; a sweep already in flight keeps its own
+        self.start, self.stop, self.points = start, stop, points
+
+    def _request(self):
+        self._requested_at = time.time()
+        self._span = (self.start, self.stop, self.points)
+        if self.transfer == 'binary':
+            self.vna.request_scan_binary(self.start, self.stop, self.points)
+        elif self.scan:
+            self.vna.send_scan(self.start, self.stop, self.points)
+            self.vna.send_command("data 1\r")
+        else:
+            self.vna.fetch_frequencies()
+            self.vna.send_command("data 1\r")
+        self._in_flight = True
+
+    def _receive(self):
+        self._in_flight = False
+        self.requested_at = self._requested_at
+        self.span = self._span
+        if self.transfer == 'binary':
+            records = self.vna.read_scan_binary()
+            self.freq = records['freq']
+            return records['s21']
+        self.freq = np.linspace(*self._span) if self.scan else self.vna.frequencies
+        return self.vna.fetch_data()
+
+    def _parse(self, raw):
+        if self.transfer == 'binary':
+            return raw
+        return parse_complex_block(raw)
+
+    def sweep(self):
+        if not self._in_flight:
+            self._request()
+        raw = self._receive()
+        if self.pipeline:
+            self._request()
+        return self._parse(raw)
+
+    def drain(self):
+        # collect the sweep still in flight before other commands are sent
+        if self._in_flight:
+            self._receive()
+
+
+# Span of the next sweep in adaptive (roi) mode. Every coarse_every-th sweep
+# covers the full span with coarse_points; the others put roi_points into
+# roi_width (Hz) around the tracked peak. While no peak is tracked every sweep
+# is a coarse one, which re-acquires a lost peak. A polynomial baseline fitted
+# to a narrow window absorbs most of the dip, so narrow sweeps reuse the
+# baseline of the last coarse sweep.
+class RoiSweepPlanner(object):
+
+    def __init__(self, start, stop, coarse_points=26, roi_points=26, roi_width=0.6e6,
+                 coarse_every=8):
+        self.roi_points = roi_points
+        self.roi_width = roi_width
+        self.coarse_every = coarse_every
+        self.coarse_span = (int(start), int(stop), coarse_points)
+        self._count = 0
+        self._coarse_baseline = None
+        self.coarse_sweeps = 0
+        self.roi_sweeps = 0
+
+    def set_span(self, start, stop):
+        self.coarse_span = (int(start), int(stop), self.coarse_span[2])
+        self._coarse_baseline = None
+
+    def is_coarse(self, span):
+        return span == self.coarse_span
+
+    def baseline(self, span, x):
+        # baseline for a narrow sweep on axis x, None when it has to be fitted
+        if self.is_coarse(span) or self._coarse_baseline is None:
+            return None
+        coarse_x, coarse_base = self._coarse_baseline
+        return np.interp(x, coarse_x, coarse_base)
+
+    def update(self, span, x, base, peak_freq):
+        # x, base: axis (any unit, as passed to baseline()) and baseline of the
+        # swept window; peak_freq (Hz) is nan when no peak was found
+        if self.is_coarse(span):
+            self._coarse_baseline = (np.array(x), np.array(base))
+        return self.next_span(peak_freq)
+
+    def next_span(self, peak_freq):
+        start, stop, _ = self.coarse_span
+        self._count = self._count + 1
+        if np.isnan(peak_freq) or self._count >= self.coarse_every \
+                or self.roi_width >= stop - start:
+            self._count = 0
+            self.coarse_sweeps = self.coarse_sweeps + 1
+            return self.coarse_span
+
+        half = self.roi_width / 2
+        center = min(max(peak_freq, start + half), stop - half)
+        self.roi_sweeps = self.roi_sweeps + 1
+        return (int(center - half), int(center + half), self.roi_points)
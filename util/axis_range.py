@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import math
+
+
+# View range of one plot axis that only moves when the data needs it to.
+# The range is the data range rounded out to multiples of step (no rounding
+# when step is None) plus margin. It is kept while the data stays inside it
+# and still needs at least (1 - hysteresis) of its span, so noise around a
+# rounding boundary does not re-layout the view box every frame.
+class AxisRange(object):
+
+    def __init__(self, set_range, step=None, margin=0.0, hysteresis=0.5, padding=0.05):
+        # set_range: e.g. plot.setYRange, called as set_range(lo, hi, padding=padding)
+        self.set_range = set_range
+        self.step = step
+        self.margin = margin
+        self.hysteresis = hysteresis
+        self.padding = padding
+        self.range = None
+        self.updates = 0
+        self.skipped = 0
+
+    def reset(self):
+        # the next update() sets the range again
+        self.range = None
+
+    def _target(self, lo, hi):
+        if self.step:
+            lo = self.step * math.floor(lo / self.step)
+            hi = self.step * math.ceil(hi / self.step)
+        return lo - self.margin, hi + self.margin
+
+    def update(self, lo, hi):
+        # returns True when the view range was changed
+        target = self._target(lo, hi)
+        if self.range is not None:
+            cur_lo, cur_hi = self.range
+            if cur_lo <= target[0] and target[1] <= cur_hi and \
+                    target[1] - target[0] >= (1 - self.hysteresis) * (cur_hi - cur_lo):
+                self.skipped = self.skipped + 1
+                return False
+
+        self.range = target
+        self.set_range(target[0], target[1], padding=self.padding)
+        self.updates = self.updates + 1
+        return True
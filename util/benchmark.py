@@ -0,0 +1,740 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import zlib
+import argparse
+import tempfile
+import tracemalloc
+
+from configparser import ConfigParser
+
+import numpy as np
+
+from util.nanovna import NanoVNA, parse_float_block, parse_complex_block, parse_hex_block
+from util.fake_nanovna import FakeNanoVNASerial
+from util.acquisition import NanoVNASweeper, RoiSweepPlanner
+from util.peak_detector import detect_peak_with_polyfit, detect_peaks_batch, PolyBaseline, \
+    PeakDetector, PeakTracker
+from util.state_classifier import StateClassifier
+from util.helper_func import findNearestID
+from util.state_events import StateEventEngine
+from util.s21_log import S21Recorder
+from util.capture import encode_delta, decode_delta, CaptureWriter, FRAME_DTYPE
+
+SAMPLE_LOG = 'sample_log/s21_press_ring.npy'
+SAMPLE_INI = 'setting/default.ini'
+SENSOR_LIST = ['switch', 'slider', 'joystick', 'scroll', 'mouse']
+
+
+def _timeit(func, repeat):
+    func()  # warm up
+    st = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - st) / repeat
+
+
+def _fake_vna(points=101, log=None, latency=0.0, sweep_time=0.0, point_time=0.0,
+              dip_freq=None):
+    vna = NanoVNA(dev='fake')
+    span = {} if log is None else {'start': log[0][0]*1e6, 'stop': log[0][-1]*1e6}
+    vna.serial = FakeNanoVNASerial(s21_dB=log, points=points, latency=latency,
+                                   sweep_time=sweep_time, point_time=point_time,
+                                   dip_freq=dip_freq, **span)
+    return vna
+
+
+def _histogram(values, bins=8, width=40):
+    counts, edges = np.histogram(values, bins=bins)
+    for cnt, lo, hi in zip(counts, edges[:-1], edges[1:]):
+        bar = '#' * int(round(width * cnt / max(counts.max(), 1)))
+        print('    {:6.2f}-{:6.2f} ms | {:<{}s} {}'.format(lo, hi, bar, width, cnt))
+
+
+def _legacy_fetch_data(serial):
+    # byte-at-a-time reader kept as the reference implementation
+    result = ''
+    line = ''
+    while True:
+        c = serial.read().decode('utf-8')
+        line += c
+        if c == chr(10):
+            result += line
+            line = ''
+        if line.endswith('ch>'):
+            break
+    return result
+
+
+def bench_fetch_data(points_list=(101, 401, 1601), repeat=50):
+    print('fetch_data (data 1 response)')
+    for points in points_list:
+        legacy_serial = FakeNanoVNASerial(points=points)
+        vna = _fake_vna(points)
+
+        def legacy_sweep():
+            legacy_serial.write(b"data 1\r")
+            legacy_serial.readline()
+            return _legacy_fetch_data(legacy_serial)
+
+        def buffered_sweep():
+            vna.send_command("data 1\r")
+            return vna.fetch_data()
+
+        # equality with the byte-wise reader: tests/test_nanovna_transfer.py
+        t_legacy = _timeit(legacy_sweep, repeat)
+        t_buffered = _timeit(buffered_sweep, repeat)
+        print('  {:5d} points: byte-wise {:7.2f} ms, buffered {:7.2f} ms ({:.1f}x)'.format(
+            points, t_legacy*1e3, t_buffered*1e3, t_legacy/t_buffered))
+
+
+# list-based parsers kept as the golden reference for the block parsers
+def _legacy_parse_complex(data):
+    x = []
+    for line in data.split('\n'):
+        if line:
+            d = line.strip().split(' ')
+            x.append(float(d[0])+float(d[1])*1.j)
+    return np.array(x)
+
+
+def _legacy_parse_float(data):
+    x = []
+    for line in data.split('\n'):
+        if line:
+            x.append(float(line))
+    return np.array(x)
+
+
+def _legacy_parse_hex(data):
+    x = []
+    for line in data.split('\n'):
+        if line:
+            x.extend([int(d, 16) for d in line.strip().split(' ')])
+    return np.array(x).astype(np.int16)
+
+
+def _response(vna, cmd):
+    vna.send_command(cmd)
+    return vna.fetch_data()
+
+
+def bench_parser(points_list=(101, 401, 1601), repeat=50):
+    print('ascii block parser')
+    for points in points_list:
+        vna = _fake_vna(points)
+        cases = [('data', _response(vna, "data 1\r"),
+                  _legacy_parse_complex, parse_complex_block),
+                 ('frequencies', _response(vna, "frequencies\r"),
+                  _legacy_parse_float, parse_float_block),
+                 ('dump', _response(vna, "dump 0\r") * (points // 96 + 1),
+                  _legacy_parse_hex, parse_hex_block)]
+        # equality with the list-based output: tests/test_nanovna_parser.py
+        for name, text, legacy, block in cases:
+            t_legacy = _timeit(lambda: legacy(text), repeat)
+            t_block = _timeit(lambda: block(text), repeat)
+            print('  {:5d} points {:12s}: lists {:7.3f} ms, block {:7.3f} ms ({:.1f}x)'.format(
+                points, name, t_legacy*1e3, t_block*1e3, t_legacy/t_block))
+
+
+def bench_transfer(points_list=(101, 401, 1601), repeat=50, latency=0.001):
+    print('sweep transfer (fake device, {:.1f} ms turnaround per command)'.format(
+        latency*1e3))
+    for points in points_list:
+        vna = _fake_vna(points, latency=latency)
+        start, stop = vna.serial.start, vna.serial.stop
+
+        def ascii_sweep():
+            vna.fetch_frequencies(force=True)
+            return vna.data(1)
+
+        def cached_sweep():
+            vna.fetch_frequencies()
+            return vna.data(1)
+
+        def binary_sweep():
+            return vna.scan_binary(start, stop, points)['s21']
+
+        # equivalence of the binary scan and the ascii sweep: tests/test_nanovna_transfer.py
+        t_ascii = _timeit(ascii_sweep, repeat)
+        avoided = vna.frequency_fetches_avoided
+        t_cached = _timeit(cached_sweep, repeat)
+        avoided = vna.frequency_fetches_avoided - avoided
+        t_binary = _timeit(binary_sweep, repeat)
+        print('  {:5d} points: ascii {:7.1f} sweeps/s, ascii+cached freq {:7.1f} sweeps/s '
+              '({} fetches avoided), binary {:7.1f} sweeps/s'.format(
+                  points, 1/t_ascii, 1/t_cached, avoided, 1/t_binary))
+
+
+def bench_pipeline(frames=200, latency=0.001, sweep_time=0.01, transfer='ascii'):
+    log = np.load(SAMPLE_LOG)
+    points = log.shape[1]
+    print('acquisition loop on the replay stand-in ({} points, {:.1f} ms sweep, '
+          '{:.1f} ms turnaround, {})'.format(points, sweep_time*1e3, latency*1e3, transfer))
+    for pipeline in (False, True):
+        vna = _fake_vna(points, log=log, latency=latency, sweep_time=sweep_time)
+        sweeper = NanoVNASweeper(vna, vna.serial.start, vna.serial.stop, points,
+                                 transfer=transfer, pipeline=pipeline)
+        latencies = []
+        st = time.perf_counter()
+        for _ in range(frames):
+            s21 = sweeper.sweep()
+            dB = 20 * np.log10(np.abs(s21), dtype=np.float64)
+            detect_peak_with_polyfit(deg=4, thres=0.03, y=dB, x=log[0])
+            latencies.append((time.time() - sweeper.requested_at) * 1e3)
+        elapsed = time.perf_counter() - st
+        sweeper.drain()
+        print('  {}: {:.1f} frames/s, latency median {:.2f} ms, p95 {:.2f} ms'.format(
+            'pipelined' if pipeline else 'sequential', frames / elapsed,
+            np.median(latencies), np.percentile(latencies, 95)))
+        _histogram(latencies)
+
+
+def bench_baseline(points_list=(51, 101, 401, 1601), repeat=200, deg=4):
+    print('degree-{} baseline fit'.format(deg))
+    log = np.load(SAMPLE_LOG)
+    for points in points_list:
+        x = np.linspace(27, 30, points)
+        y = np.interp(x, log[0], log[len(log) // 2])
+        baseline = PolyBaseline(deg)
+
+        # equivalence with np.polyfit: tests/test_poly_baseline.py
+        reference = np.poly1d(np.polyfit(x, y, deg))(x)
+        error = np.max(np.abs(baseline.fit(y, x) - reference))
+
+        t_polyfit = _timeit(lambda: np.poly1d(np.polyfit(x, y, deg))(x), repeat)
+        t_cached = _timeit(lambda: baseline.fit(y, x), repeat)
+        print('  {:5d} points: polyfit {:7.1f} us, cached pinv {:7.1f} us ({:.1f}x), '
+              'max diff {:.1e} dB'.format(points, t_polyfit*1e6, t_cached*1e6,
+                                          t_polyfit/t_cached, error))
+
+
+def bench_batch(frames=6000, thres=0.03):
+    log = np.load(SAMPLE_LOG)
+    freq = log[0]
+    Y = np.resize(log[1:], (frames, len(freq)))
+    print('offline peak detection over {} recorded frames'.format(frames))
+
+    st = time.perf_counter()
+    rows = [detect_peak_with_polyfit(deg=4, thres=thres, y=y, x=freq) for y in Y]
+    t_rows = time.perf_counter() - st
+
+    st = time.perf_counter()
+    peaks, base_dB, filtered_diff_dB, diff_dB = detect_peaks_batch(
+        deg=4, thres=thres, Y=Y, x=freq)
+    t_batch = time.perf_counter() - st
+
+    # equality with per-frame detection: tests/test_peak_detector.py
+    print('  per frame {:.2f} s ({:.0f} frames/s), batch {:.2f} s ({:.0f} frames/s)'.format(
+        t_rows, frames / t_rows, t_batch, frames / t_batch))
+
+
+def bench_detector(points_list=(51, 101, 401, 1601), repeat=200, thres=0.03):
+    print('per-frame detector allocations (tracemalloc) and time')
+    log = np.load(SAMPLE_LOG)
+    for points in points_list:
+        x = np.linspace(27, 30, points)
+        y = np.interp(x, log[0], log[len(log) // 2])
+        detector = PeakDetector(deg=4, track_alloc=True)
+
+        def stateful():
+            result = detector.detect(thres, y, x)
+            detector.release(result[1])
+            return result
+
+        # equivalence with detect_peak_with_polyfit: tests/test_peak_detector.py
+        stateful()
+        stateful()
+        detector_bytes = detector.alloc_bytes, detector.peak_search_alloc_bytes
+        tracemalloc.reset_peak()
+        mark = tracemalloc.get_traced_memory()[0]
+        detect_peak_with_polyfit(4, thres, y, x)
+        function_bytes = tracemalloc.get_traced_memory()[1] - mark
+        tracemalloc.stop()
+
+        detector.track_alloc = False
+        t_function = _timeit(lambda: detect_peak_with_polyfit(4, thres, y, x), repeat)
+        t_stateful = _timeit(stateful, repeat)
+        print('  {:5d} points: function {:7d} B/frame {:6.1f} us, detector {:5d} B/frame '
+              '(+{} B in find_peaks) {:6.1f} us'.format(
+                  points, function_bytes, t_function*1e6, detector_bytes[0],
+                  detector_bytes[1], t_stateful*1e6))
+
+
+def _track(frames, x, method, thres=0.03):
+    tracker = PeakTracker(PeakDetector(deg=4), method=method)
+    peak_freq = np.empty(len(frames))
+    for i, y in enumerate(frames):
+        result = tracker.track(thres, y, x)
+        tracker.detector.release(result[1])
+        peak_freq[i] = result[4]
+    return peak_freq
+
+
+def _print_error(label, error):
+    error = np.abs(error[~np.isnan(error)])
+    if len(error) == 0:
+        print('    {:10s} no peak'.format(label))
+        return
+    print('    {:10s} median {:6.1f} kHz, p95 {:6.1f} kHz, max {:6.1f} kHz'.format(
+        label, np.median(error)*1e3, np.percentile(error, 95)*1e3, np.max(error)*1e3))
+
+
+def _fitted_peaks(frames, x, thres=0.03):
+    # reference independent of the 3-point refinements: a lorentzian fitted
+    # by least squares to the bins of the full-resolution dip above half its
+    # depth (at least 2 on each side); nan where no peak is found or the fit
+    # does not converge inside those bins
+    from scipy.optimize import curve_fit
+
+    def lorentzian(x, depth, centre, width, offset):
+        return depth / (1 + ((x - centre) / width)**2) + offset
+
+    detector = PeakDetector(deg=4)
+    peak_freq = np.full(len(frames), np.nan)
+    for i, y in enumerate(frames):
+        peak_ids, base, filtered, diff = detector.detect(thres, y, x)
+        k = int(peak_ids[np.argmax(filtered[peak_ids])]) if len(peak_ids) else None
+        diff = diff.copy()
+        detector.release(base)
+        if k is None:
+            continue
+        lo, hi = k, k
+        while lo > 0 and (k - lo < 2 or diff[lo - 1] >= diff[k] / 2):
+            lo = lo - 1
+        while hi < len(x) - 1 and (hi - k < 2 or diff[hi + 1] >= diff[k] / 2):
+            hi = hi + 1
+        try:
+            popt, _ = curve_fit(lorentzian, x[lo:hi + 1], diff[lo:hi + 1],
+                                p0=(diff[k], x[k], x[hi] - x[lo], 0.0), maxfev=2000)
+        except RuntimeError:
+            continue
+        if x[lo] <= popt[1] <= x[hi]:
+            peak_freq[i] = popt[1]
+    return peak_freq
+
+
+def bench_tracker(points_list=(13, 26, 51, 101), frames=200, methods=('none', 'parabolic',
+                                                                      'lorentzian')):
+    # synthetic lorentzian dips at known frequencies on a sloped S21 curve
+    print('peak frequency error vs sweep points (27-30 MHz, known dip frequency)')
+    rng = np.random.default_rng(0)
+    truth = rng.uniform(27.5, 29.5, frames)
+    for points in points_list:
+        x = np.linspace(27, 30, points)
+        frames_dB = -20 - 0.5 * (x - 27) - 0.4 / (1 + ((x - truth[:, None]) / 0.08)**2)
+        print('  {:5d} points ({:.0f} kHz/bin)'.format(points, (x[1] - x[0])*1e3))
+        for method in methods:
+            _print_error(method, _track(frames_dB, x, method) - truth)
+
+    # sample log decimated; reference: lorentzian least-squares fit to the
+    # full-resolution sweep, which none of the compared methods uses
+    log = np.load(SAMPLE_LOG)
+    freq, frames_dB = log[0], log[1:]
+    reference = _fitted_peaks(frames_dB, freq)
+    print('sample log peak frequency vs lorentzian fit of the full-resolution sweep '
+          '({} of {} frames fitted)'.format(np.count_nonzero(~np.isnan(reference)),
+                                            len(reference)))
+    for step in (1, 2, 3, 4):
+        x = freq[::step]
+        print('  {:5d} points ({:.0f} kHz/bin)'.format(len(x), (x[1] - x[0])*1e3))
+        for method in methods:
+            _print_error(method, _track(frames_dB[:, ::step], x, method) - reference)
+
+
+def bench_roi(frames=300, latency=0.001, point_time=0.0002, transfer='binary',
+              dip_freq=28.43e6):
+    print('full-span vs adaptive roi sweeps (27-30 MHz, {:.1f} ms/point, {:.1f} ms '
+          'turnaround, {}, dip at {:.2f} MHz)'.format(
+              point_time*1e3, latency*1e3, transfer, dip_freq/1e6))
+    for mode in ('full', 'roi'):
+        vna = _fake_vna(101, latency=latency, point_time=point_time, dip_freq=dip_freq)
+        sweeper = NanoVNASweeper(vna, 27e6, 30e6, 101, transfer=transfer, scan=mode == 'roi')
+        planner = RoiSweepPlanner(27e6, 30e6) if mode == 'roi' else None
+        if planner is not None:
+            sweeper.retune(*planner.coarse_span)
+        tracker = PeakTracker(PeakDetector(deg=4))
+
+        peak_freq = np.empty(frames)
+        st = time.perf_counter()
+        for i in range(frames):
+            s21 = sweeper.sweep()
+            dB = 20 * np.log10(np.abs(s21), dtype=np.float64)
+            x = sweeper.freq / 1e6
+            baseline = None if planner is None else planner.baseline(sweeper.span, x)
+            if baseline is not None:
+                baseline -= tracker.detector.offset
+            _, base, _, _, peak_freq[i] = tracker.track(0.03, dB, x, baseline=baseline)
+            if planner is not None:
+                sweeper.retune(*planner.update(sweeper.span, x, base, peak_freq[i]*1e6))
+            tracker.detector.release(base)
+        elapsed = time.perf_counter() - st
+        sweeper.drain()
+
+        error = np.abs(peak_freq - dip_freq/1e6) * 1e3
+        sweeps = '' if planner is None else ' ({} coarse, {} roi)'.format(
+            planner.coarse_sweeps, planner.roi_sweeps)
+        print('  {:4s}: {:6.1f} frames/s{}, peak error median {:5.1f} kHz, '
+              'p95 {:5.1f} kHz, lost {}'.format(
+                  mode, frames / elapsed, sweeps, np.nanmedian(error),
+                  np.nanpercentile(error, 95), np.count_nonzero(np.isnan(error))))
+
+
+def _legacy_sensor_states(cells, peak):
+    # SensorViewer before the lookup table: every table cell is parsed and
+    # every sensor searched with findNearestID on each frame
+    sensor_info = {}
+    for sensor, (state_list, texts) in cells.items():
+        peak_list = [float(text) for text in texts[:-1]]
+        peak_range = float(texts[-1])
+        id = findNearestID(array=peak_list, value=peak)
+        sensor_info[sensor] = state_list[id] if (
+            np.abs(peak_list[id] - peak) < peak_range/2) else 'none'
+    return sensor_info
+
+
+def bench_classifier(frames=20000):
+    parser = ConfigParser()
+    parser.read(SAMPLE_INI)
+    classifier = StateClassifier.from_parser(parser, SENSOR_LIST)
+    cells = {sensor: ([key for key in parser[sensor] if key != 'range'],
+                      [parser[sensor][key] for key in parser[sensor] if key != 'range']
+                      + [parser[sensor]['range']])
+             for sensor in SENSOR_LIST}
+    print('sensor state lookup for {} sensors over {} peaks'.format(len(SENSOR_LIST), frames))
+
+    # random peaks plus every listed frequency and the points half a range away
+    centres = np.concatenate([[float(parser[s][k]) for k in parser[s]] for s in SENSOR_LIST])
+    peaks = np.concatenate([np.random.default_rng(0).uniform(26, 30, frames),
+                            centres, centres + 0.05, centres - 0.1, centres + 0.15])
+    # equality with the findNearestID lookup: tests/test_state_classifier.py
+    peaks = peaks[:frames]
+    st = time.perf_counter()
+    for peak in peaks:
+        _legacy_sensor_states(cells, peak)
+    t_legacy = (time.perf_counter() - st) / frames
+    st = time.perf_counter()
+    for peak in peaks:
+        classifier.states(peak)
+    t_table = (time.perf_counter() - st) / frames
+    st = time.perf_counter()
+    classifier.classify(peaks)
+    t_batch = (time.perf_counter() - st) / frames
+    print('  per frame: findNearestID + table parse {:.1f} us, lookup table {:.1f} us ({:.1f}x), '
+          'batched {:.2f} us'.format(t_legacy*1e6, t_table*1e6, t_legacy/t_table, t_batch*1e6))
+
+
+def _loop_sensor_states(tables, peaks):
+    # per-peak, per-sensor python reference of StateClassifier.sensor_states
+    sensor_info = {}
+    for sensor, (state_list, peak_list, peak_range) in tables.items():
+        best = None
+        for peak in peaks:
+            id = findNearestID(array=peak_list, value=peak)
+            distance = np.abs(peak_list[id] - peak)
+            if distance < peak_range/2 and (best is None or distance < best[0]):
+                best = (distance, state_list[id])
+        sensor_info[sensor] = 'none' if best is None else best[1]
+    return sensor_info
+
+
+def bench_multi_peak(frames=500, points=101, thres=0.03):
+    # three rings on one reader, two states each
+    tables = {'ring_{}'.format(i): (['off', 'on'], [27.3 + i, 27.6 + i], 0.2) for i in range(3)}
+    classifier = StateClassifier(tables)
+    print('{} rings read from one {}-point sweep, {} frames'.format(len(tables), points, frames))
+
+    rng = np.random.default_rng(0)
+    truth = rng.integers(0, 2, (frames, len(tables)))
+    centres = np.array([peak_list for _, peak_list, _ in tables.values()])
+    dips = centres[np.arange(len(tables)), truth] + rng.normal(0, 0.01, truth.shape)
+    x = np.linspace(27, 30, points)
+    frames_dB = -20 - 0.5 * (x - 27) - np.sum(
+        0.4 / (1 + ((x - dips[:, :, None]) / 0.05)**2), axis=1)
+
+    tracker = PeakTracker(PeakDetector(deg=4, peak_kind='all'))
+    peak_freqs = []
+    for y in frames_dB:
+        result = tracker.track(thres, y, x)
+        tracker.detector.release(result[1])
+        peak_freqs.append(tracker.peak_freqs)
+
+    # equality with the per-peak loop: tests/test_state_classifier.py
+    results = [classifier.sensor_states(peaks) for peaks in peak_freqs]
+    correct = np.mean([[info[sensor] == ['off', 'on'][state]
+                        for sensor, state in zip(tables, states)]
+                       for info, states in zip(results, truth)])
+
+    t_loop = _timeit(lambda: [_loop_sensor_states(tables, p) for p in peak_freqs], 3) / frames
+    t_vector = _timeit(lambda: [classifier.sensor_states(p) for p in peak_freqs], 3) / frames
+    t_table = _timeit(lambda: [classifier.classify_peaks(p) for p in peak_freqs], 3) / frames
+    print('  {:.1f} peaks/frame, {:.1%} of ring states right; per frame: per-peak loop '
+          '{:.1f} us, vectorized {:.1f} us (structured array only {:.1f} us)'.format(
+              np.mean([len(p) for p in peak_freqs]), correct, t_loop*1e6, t_vector*1e6,
+              t_table*1e6))
+
+
+def bench_events(seconds=60, fps=100, flicker=0.05):
+    # a switch held on/off for random times, with single-frame flickers
+    rng = np.random.default_rng(0)
+    held = rng.uniform(0.2, 2.0, seconds * 5)
+    states = np.repeat(np.resize(['off', 'on'], len(held)), (held * fps).astype(int))
+    states = states[:seconds * fps]
+    flips = rng.random(len(states)) < flicker
+    states[flips] = np.where(states[flips] == 'on', 'off', 'on')
+    sensor_info = [{'switch': state} for state in states]
+
+    engine = StateEventEngine(debounce=0.03, long_press=1.0, hold_repeat=0.2,
+                              idle_states=('none', 'off'))
+    kinds = {}
+    st = time.perf_counter()
+    for i, info in enumerate(sensor_info):
+        for event in engine.update(info, t=i / fps):
+            kinds[event.kind] = kinds.get(event.kind, 0) + 1
+    elapsed = time.perf_counter() - st
+    print('state events from {} frames ({} s at {} fps, {:.0%} flicker frames)'.format(
+        len(states), seconds, fps, flicker))
+    print('  {} events ({:.1%} of the per-frame signals): {}, {:.1f} us/frame'.format(
+        engine.events, engine.events / engine.frames,
+        ', '.join('{} {}'.format(n, kind) for kind, n in sorted(kinds.items())),
+        elapsed / engine.frames * 1e6))
+
+
+def _legacy_timeline(plot, depth):
+    # full-buffer setData of every frame, as the viewers did before RingTimeline
+    x, y = np.arange(depth), np.zeros(depth)
+    curve = plot.plot(x, y)
+    marker = pg.ScatterPlotItem(size=20)
+    plot.addItem(marker)
+    plot.setXRange(0, depth, padding=0.05)
+    count = [0]
+
+    def push(value):
+        i = count[0] % depth
+        y[i] = value
+        curve.setData(x, y)
+        marker.setData([x[i]], [y[i]])
+        count[0] = count[0] + 1
+    return push
+
+
+def bench_timeline(depths=(200, 2000, 10000), frames=500):
+    # without a display Qt would abort the whole run, so draw offscreen
+    if sys.platform.startswith('linux') and not (os.environ.get('DISPLAY')
+                                                 or os.environ.get('WAYLAND_DISPLAY')):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    global pg
+    import pyqtgraph as pg
+    from PyQt5.QtWidgets import QApplication
+    from util.ring_timeline import RingTimeline
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    values = 27 + 2 * np.random.default_rng(0).random(frames)
+    for depth in depths:
+        print('timeline of {} points, {} frames'.format(depth, frames))
+        for label in ('full setData', 'RingTimeline'):
+            plot = pg.PlotWidget()
+            plot.resize(600, 400)
+            plot.setYRange(27, 29)
+            if label == 'RingTimeline':
+                push = RingTimeline(plot, depth=depth).push
+            else:
+                push = _legacy_timeline(plot, depth)
+            plot.show()
+            # fill the ring first: a full ring is the steady state
+            for i in range(depth):
+                push(values[i % frames])
+            app.processEvents()
+
+            st = time.perf_counter()
+            for value in values:
+                push(value)
+            update = time.perf_counter() - st
+            st = time.perf_counter()
+            for value in values:
+                push(value)
+                plot.viewport().repaint()
+            draw = time.perf_counter() - st
+            print('  {:<13s}: push {:7.1f} us, push + repaint {:7.1f} us'.format(
+                label, update / frames * 1e6, draw / frames * 1e6))
+            plot.close()
+
+
+def _record(path, freq, dB, fps):
+    # puts every row at fps (0: as fast as possible), as GraphViewer.updateGraph does
+    recorder = S21Recorder(path, freq)
+    recorder.start()
+    put = 0
+    st = time.perf_counter()
+    for i, row in enumerate(dB):
+        t = time.perf_counter()
+        recorder.put(freq, row, t)
+        put = put + time.perf_counter() - t
+        wait = st + (i + 1) / fps - time.perf_counter() if fps else 0
+        if wait > 0:
+            time.sleep(wait)
+    t = time.perf_counter()
+    recorder.close()
+    return recorder, put / len(dB), time.perf_counter() - t
+
+
+def bench_recorder(frames=20000, points=101, fps=1000):
+    freq = np.linspace(27, 30, points)
+    dB = np.random.default_rng(0).normal(-20, 1, (frames, points))
+    print('S21 recording of {} frames x {} points'.format(frames, points))
+    with tempfile.TemporaryDirectory() as tmp:
+        st = time.perf_counter()
+        log = [freq]
+        for row in dB[:200]:
+            log.append(row)
+        np.save(os.path.join(tmp, 'list.npy'), log)
+        print('  list + np.save           : capped at 200 frames, {:.1f} ms blocking save'.format(
+            (time.perf_counter() - st) * 1e3))
+
+        for label, rate in (('{} fps'.format(fps), fps), ('unpaced burst', 0)):
+            recorder, put, close = _record(os.path.join(tmp, 'stream.npy'), freq, dB, rate)
+            print('  S21Recorder {:<13s}: {:.1f} us/put, {:.1f} ms close, {} written, '
+                  '{} dropped, {:.1f} MB'.format(label, put * 1e6, close * 1e3, recorder.frames,
+                                                 recorder.dropped,
+                                                 os.path.getsize(recorder.path) / 1e6))
+
+
+def _decode_rate(decode, nbytes, repeat):
+    st = time.perf_counter()
+    for _ in range(repeat):
+        decode()
+    return nbytes * repeat / (time.perf_counter() - st) / 1e6
+
+
+def bench_compress(resolutions=(0.01, 0.001, 0.0001), chunk=64, repeat=200):
+    log = np.load(SAMPLE_LOG)
+    freq, frames = log[0], log[1:]
+    chunks = [frames[i:i + chunk] for i in range(0, len(frames), chunk)]
+    table = np.zeros(chunk, dtype=FRAME_DTYPE)
+    print('compression of {} ({} frames x {} points, {:.1f} kB float64)'.format(
+        SAMPLE_LOG, len(frames), len(freq), frames.nbytes / 1e3))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def capture_size(encoding, resolution=0.001):
+            path = os.path.join(tmp, '{}_{}.npz'.format(encoding, resolution))
+            writer = CaptureWriter(path, freq, encoding=encoding, resolution=resolution)
+            for rows in chunks:
+                writer.write(rows, table[:len(rows)])
+            return os.path.getsize(path)
+
+        raw_size = capture_size('raw')
+        print('  raw capture           : {:.1f} kB'.format(raw_size / 1e3))
+
+        payloads = [zlib.compress(rows.tobytes(), 1) for rows in chunks]
+        rate = _decode_rate(lambda: [np.frombuffer(zlib.decompress(p)) for p in payloads],
+                            frames.nbytes, repeat)
+        print('  zlib float64          : ratio {:5.2f}, exact, decode {:.0f} MB/s'.format(
+            frames.nbytes / sum(len(p) for p in payloads), rate))
+
+        def float16_decode(base, payload):
+            return np.frombuffer(zlib.decompress(payload), dtype=np.float16).reshape(
+                -1, len(base)) + base
+
+        payloads = [(rows[0], zlib.compress((rows - rows[0]).astype(np.float16).tobytes(), 1))
+                    for rows in chunks]
+        rate = _decode_rate(lambda: [float16_decode(base, p) for base, p in payloads],
+                            frames.nbytes, repeat)
+        error = max(np.abs(float16_decode(base, p) - rows).max()
+                    for (base, p), rows in zip(payloads, chunks))
+        print('  float16 delta + zlib  : ratio {:5.2f}, max error {:.5f} dB, decode {:.0f} MB/s'.format(
+            frames.nbytes / sum(len(p) + base.nbytes for base, p in payloads), error, rate))
+
+        # round trips of the encoding and the capture: tests/test_capture.py
+        for resolution in resolutions:
+            encoded = [encode_delta(rows, resolution) for rows in chunks]
+            rate = _decode_rate(lambda: [decode_delta(base, p, resolution) for base, p in encoded],
+                                frames.nbytes, repeat)
+            error = max(np.abs(decode_delta(base, p, resolution) - rows).max()
+                        for (base, p), rows in zip(encoded, chunks))
+            print('  delta {:<6g} dB       : ratio {:5.2f}, max error {:.5f} dB, decode {:.0f} MB/s, '
+                  'capture {:.1f}x smaller'.format(
+                      resolution, frames.nbytes / sum(p.nbytes + base.nbytes for base, p in encoded),
+                      error, rate, raw_size / capture_size('delta', resolution)))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fetch", help="serial framing of NanoVNA.fetch_data",
+                        action="store_true")
+    parser.add_argument("--parse", help="ascii block parsers vs list-based parsing",
+                        action="store_true")
+    parser.add_argument("--transfer", help="ascii vs binary sweep transfer",
+                        action="store_true")
+    parser.add_argument("--latency", type=float, default=0.001,
+                        help="fake device turnaround per command (s)")
+    parser.add_argument("--pipeline", help="sequential vs pipelined acquisition loop",
+                        action="store_true")
+    parser.add_argument("--sweep-time", type=float, default=0.01,
+                        help="fake device measuring time per sweep (s)")
+    parser.add_argument("--baseline", help="cached polynomial baseline vs np.polyfit",
+                        action="store_true")
+    parser.add_argument("--batch", help="batched vs per-frame offline detection",
+                        action="store_true")
+    parser.add_argument("--detector", help="allocation-free detector vs function",
+                        action="store_true")
+    parser.add_argument("--tracker", help="peak frequency accuracy vs sweep points",
+                        action="store_true")
+    parser.add_argument("--roi", help="full-span vs adaptive roi sweeps",
+                        action="store_true")
+    parser.add_argument("--classifier", help="sensor state lookup table vs findNearestID",
+                        action="store_true")
+    parser.add_argument("--multi-peak", help="several rings classified from one sweep",
+                        action="store_true")
+    parser.add_argument("--events", help="debounced state events vs per-frame states",
+                        action="store_true")
+    parser.add_argument("--timeline", help="ring-buffer timeline vs full setData",
+                        action="store_true")
+    parser.add_argument("--record", help="streaming S21 recorder vs list + np.save",
+                        action="store_true")
+    parser.add_argument("--compress", help="delta encoded vs raw capture frames",
+                        action="store_true")
+    parser.add_argument("-r", "--repeat", type=int, default=50)
+    args = parser.parse_args(argv[1:])
+
+    run_all = not (args.fetch or args.parse or args.transfer or args.pipeline
+                   or args.baseline or args.batch or args.detector or args.tracker
+                   or args.roi or args.classifier or args.multi_peak
+                   or args.events or args.timeline or args.record or args.compress)
+
+    if args.fetch or run_all:
+        bench_fetch_data(repeat=args.repeat)
+    if args.parse or run_all:
+        bench_parser(repeat=args.repeat)
+    if args.transfer or run_all:
+        bench_transfer(repeat=args.repeat, latency=args.latency)
+    if args.pipeline or run_all:
+        bench_pipeline(latency=args.latency, sweep_time=args.sweep_time)
+    if args.baseline or run_all:
+        bench_baseline(repeat=args.repeat)
+    if args.batch or run_all:
+        bench_batch()
+    if args.detector or run_all:
+        bench_detector(repeat=args.repeat)
+    if args.tracker or run_all:
+        bench_tracker()
+    if args.roi or run_all:
+        bench_roi(latency=args.latency)
+        bench_roi(latency=args.latency, transfer='ascii')
+    if args.classifier or run_all:
+        bench_classifier()
+    if args.multi_peak or run_all:
+        bench_multi_peak()
+    if args.events or run_all:
+        bench_events()
+    if args.timeline or run_all:
+        bench_timeline()
+    if args.record or run_all:
+        bench_recorder()
+    if args.compress or run_all:
+        bench_compress()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
+    sys.exit()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import io
+import json
+import zlib
+import struct
+import zipfile
+
+import numpy as np
+
+# per-frame table of a capture; peak_freq (MHz) is the refined deepest peak,
+# nan when no peak was detected
+FRAME_DTYPE = np.dtype([('time', np.float64), ('thres', np.float64),
+                        ('peak_freq', np.float64), ('peaks', np.int16)])
+
+
+def _npy_bytes(array):
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, np.asanyarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _chunk_name(kind, start, count):
+    return '{}_{:010d}_{:06d}.npy'.format(kind, start, count)
+
+
+def encode_delta(rows, resolution=0.001):
+    # baseline-delta encoding of a chunk of dB frames: the first frame is the
+    # base, every frame is quantized to resolution (dB) relative to it, and
+    # the change from the previous frame is stored as int16 and zlib'ed.
+    # Decoding is exact up to resolution/2. None when a change does not fit
+    # int16 or a frame is not finite (use raw frames then).
+    if not np.isfinite(rows).all():
+        return None
+    base = np.array(rows[0], dtype=np.float64)
+    steps = np.rint((rows - base) / resolution).astype(np.int32)
+    steps[1:] -= steps[:-1].copy()
+    if np.abs(steps).max(initial=0) > np.iinfo(np.int16).max:
+        return None
+    return base, np.frombuffer(zlib.compress(steps.astype('<i2').tobytes(), 1), dtype=np.uint8)
+
+
+def decode_delta(base, payload, resolution=0.001):
+    steps = np.frombuffer(zlib.decompress(payload.tobytes()), dtype='<i2')
+    steps = np.cumsum(steps.reshape(-1, len(base)), axis=0, dtype=np.int32)
+    return steps * resolution + base
+
+
+# Capture container: an uncompressed (ZIP_STORED) .npz holding
+#   freq.npy                  frequency axis (MHz), once
+#   attrs.npy                 JSON of the capture attributes, e.g. the [VNA]
+#                             section of the ini it was recorded with
+#   encoding.npy              JSON of the frame encoding
+#   frames_<start>_<n>.npy    dB of n frames from frame start on
+#   table_<start>_<n>.npy     FRAME_DTYPE row of each of those frames
+# With encoding='delta' a chunk is stored as base_<start>_<n>.npy and
+# delta_<start>_<n>.npy (encode_delta) instead of frames_..., unless it
+# cannot be encoded. The archive stays open while recording: every chunk is
+# written behind the previous one and flushed, so a write costs the same at
+# any length, and the central directory is only written by close().
+# np.load opens a closed capture like any other .npz; CaptureReader also
+# opens one that is still recorded or was cut off by a crash.
+class CaptureWriter(object):
+
+    def __init__(self, path, freq, attrs=None, encoding='raw', resolution=0.001):
+        # encoding: raw (float64 frames) or delta; resolution (dB) of delta
+        if encoding not in ('raw', 'delta'):
+            raise ValueError("encoding must be raw or delta, not {!r}".format(encoding))
+        self.path = path
+        self.freq = np.array(freq, dtype=np.float64)
+        self.encoding = encoding
+        self.resolution = resolution
+        self.frames = 0
+        self._file = open(path, 'wb')
+        self._archive = zipfile.ZipFile(self._file, 'w', zipfile.ZIP_STORED)
+        self._archive.writestr('freq.npy', _npy_bytes(self.freq))
+        self._archive.writestr('attrs.npy', _npy_bytes(np.array(json.dumps(attrs or {}))))
+        self._archive.writestr('encoding.npy', _npy_bytes(np.array(json.dumps(
+            {'frames': encoding, 'resolution': resolution}))))
+        self._file.flush()
+
+    def write(self, rows, table):
+        # rows: (n, points) dB, table: n rows of FRAME_DTYPE
+        n = len(rows)
+        rows = np.asarray(rows, dtype=np.float64)
+        encoded = encode_delta(rows, self.resolution) if self.encoding == 'delta' else None
+        if encoded is None:
+            self._archive.writestr(_chunk_name('frames', self.frames, n), _npy_bytes(rows))
+        else:
+            self._archive.writestr(_chunk_name('base', self.frames, n), _npy_bytes(encoded[0]))
+            self._archive.writestr(_chunk_name('delta', self.frames, n), _npy_bytes(encoded[1]))
+        # the table comes last: a chunk is complete once its table is there
+        self._archive.writestr(_chunk_name('table', self.frames, n),
+                               _npy_bytes(np.asarray(table, dtype=FRAME_DTYPE)))
+        self._file.flush()
+        self.frames = self.frames + n
+
+    def close(self):
+        if not self._file.closed:
+            self._archive.close()
+            self._file.close()
+
+
+# local file header of a zip member: signature, version, flags, method,
+# time, date, crc, compressed size, size, name length, extra length
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+
+def _scan_members(file):
+    # {name: (offset, size)} of the stored members, from the local headers
+    # in file order; stops at the first member that is not complete, so a
+    # capture without central directory (being recorded, or cut off) opens
+    file.seek(0, os.SEEK_END)
+    length = file.tell()
+    members = {}
+    offset = 0
+    while offset + _LOCAL_HEADER.size <= length:
+        file.seek(offset)
+        header = _LOCAL_HEADER.unpack(file.read(_LOCAL_HEADER.size))
+        signature, method, stored, size, name_length, extra_length = \
+            header[0], header[3], header[7], header[8], header[9], header[10]
+        if signature != b'PK\x03\x04' or method != zipfile.ZIP_STORED or stored != size:
+            break
+        name = file.read(name_length).decode('utf-8')
+        start = offset + _LOCAL_HEADER.size + name_length + extra_length
+        if start + size > length:
+            break
+        members[name] = (start, size)
+        offset = start + size
+    return members
+
+
+# Lazy reader of a capture: opening it only indexes the members; a chunk is
+# read when one of its frames is asked for, and the last one is kept.
+class CaptureReader(object):
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._members = _scan_members(self._file)
+        self.freq = self._read('freq.npy')
+        self.attrs = json.loads(str(self._read('attrs.npy')))
+        self.encoding = json.loads(str(self._read('encoding.npy'))) \
+            if 'encoding.npy' in self._members else {'frames': 'raw'}
+
+        starts, counts, delta = [], [], []
+        for name in self._members:
+            if name.startswith('frames_') or name.startswith('delta_'):
+                kind, start, count = os.path.splitext(name)[0].split('_')
+                if _chunk_name('table', int(start), int(count)) not in self._members:
+                    continue
+                starts.append(int(start))
+                counts.append(int(count))
+                delta.append(kind == 'delta')
+        order = np.argsort(starts)
+        self._starts = np.array(starts, dtype=np.int64)[order]
+        self._counts = np.array(counts, dtype=np.int64)[order]
+        self._delta = np.array(delta, dtype=bool)[order]
+        self.frames = int(self._counts.sum())
+        self._chunk = None
+
+    def _read(self, name):
+        offset, size = self._members[name]
+        self._file.seek(offset)
+        return np.lib.format.read_array(io.BytesIO(self._file.read(size)), allow_pickle=False)
+
+    def _load(self, index):
+        # chunk holding frame index: (start, rows, table)
+        if self._chunk is not None and 0 <= index - self._chunk[0] < len(self._chunk[1]):
+            return self._chunk
+        if not 0 <= index < self.frames:
+            raise IndexError('frame {} of a {} frame capture'.format(index, self.frames))
+        k = np.searchsorted(self._starts, index, side='right') - 1
+        start, count = int(self._starts[k]), int(self._counts[k])
+        if self._delta[k]:
+            rows = decode_delta(self._read(_chunk_name('base', start, count)),
+                                self._read(_chunk_name('delta', start, count)),
+                                self.encoding['resolution'])
+        else:
+            rows = self._read(_chunk_name('frames', start, count))
+        self._chunk = (start, rows, self._read(_chunk_name('table', start, count)))
+        return self._chunk
+
+    def row(self, index):
+        start, rows, _ = self._load(index)
+        return rows[index - start]
+
+    def time(self, index):
+        start, _, table = self._load(index)
+        return table['time'][index - start]
+
+    def table(self):
+        # the per-frame table of the whole capture
+        return np.concatenate([self._read(_chunk_name('table', start, count))
+                               for start, count in zip(self._starts, self._counts)]) \
+            if self.frames else np.empty(0, dtype=FRAME_DTYPE)
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from util.nanovna import SCAN_MASK_BINARY, SCAN_MASK_FREQ, SCAN_MASK_S11, \
+    SCAN_MASK_S21, scan_record_dtype
+
+
+# In-memory stand-in for the NanoVNA usb serial shell.
+# It answers the same commands as the firmware so that NanoVNA can be driven
+# (and benchmarked) without a device.
+class FakeNanoVNASerial(object):
+
+    PROMPT = b'ch> '
+    PACKET_SIZE = 64  # usb full speed bulk packet
+
+    def __init__(self, s21_dB=None, start=27e6, stop=30e6, points=101,
+                 latency=0.0, sweep_time=0.0, point_time=0.0, dip_freq=None):
+        # latency: usb turnaround (s) before a command is answered
+        # sweep_time, point_time: time (s) the device spends measuring for a
+        # data/scan command, fixed part and per point
+        self.latency = latency
+        self.sweep_time = sweep_time
+        self.point_time = point_time
+        self.start = start
+        self.stop = stop
+        self.points = points
+        # rows of S21 (dB) replayed one per sweep; row 0 of a log is the freq
+        # axis (MHz). Without a log, a dip at dip_freq (Hz) is synthesised.
+        self.s21_dB = s21_dB
+        self.dip_freq = (start + stop) / 2 if dip_freq is None else dip_freq
+        self.sweep_cnt = 0
+        # result of the last scan, returned by data until resume
+        self._scanned = None
+        self._txbuf = bytearray()
+        # (ready time, bytes) not yet visible to the host
+        self._pending = deque()
+        self._busy_until = 0.0
+
+    def _collect(self, wait=False):
+        if wait and self._pending:
+            delay = self._pending[0][0] - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        now = time.time()
+        while self._pending and self._pending[0][0] <= now:
+            self._txbuf += self._pending.popleft()[1]
+
+    @property
+    def in_waiting(self):
+        self._collect()
+        return min(len(self._txbuf), self.PACKET_SIZE)
+
+    def read(self, size=1):
+        # blocks like a serial port without timeout
+        self._collect()
+        while len(self._txbuf) < size and self._pending:
+            self._collect(wait=True)
+        data = bytes(self._txbuf[:size])
+        del self._txbuf[:size]
+        return data
+
+    def readline(self):
+        self._collect()
+        while b'\n' not in self._txbuf and self._pending:
+            self._collect(wait=True)
+        end = self._txbuf.find(b'\n') + 1
+        return self.read(end if end > 0 else len(self._txbuf))
+
+    def write(self, data):
+        args = data.decode().split()
+        # commands are handled one after another, each answered after the turnaround
+        start = max(time.time() + self.latency, self._busy_until)
+        # echo the command line as the firmware shell does
+        self._pending.append((start, data.rstrip(b'\r') + b'\r\n'))
+        measuring = len(args) > 0 and (args[0] == 'scan' or
+                                       (args[0] == 'data' and self._scanned is None))
+        response = self._respond(args)
+        self._busy_until = start + (
+            self.sweep_time + self.point_time * self.points if measuring else 0.0)
+        self._pending.append((self._busy_until, response + self.PROMPT))
+        return len(data)
+
+    def close(self):
+        self._txbuf = bytearray()
+        self._pending.clear()
+
+    def frequencies(self):
+        return np.linspace(self.start, self.stop, self.points)
+
+    def s21(self):
+        freq = self.frequencies()
+        if self.s21_dB is None:
+            dB = -20 - 0.5 * np.exp(-((freq - self.dip_freq) / 0.05e6)**2)
+        else:
+            rows = len(self.s21_dB) - 1
+            dB = np.interp(freq / 1e6, self.s21_dB[0],
+                           self.s21_dB[1 + self.sweep_cnt % rows])
+        self.sweep_cnt = self.sweep_cnt + 1
+        return 10**(dB/20) * np.exp(1j * np.linspace(0, np.pi, self.points))
+
+    def _binary_scan(self, mask):
+        records = np.zeros(self.points, dtype=scan_record_dtype(mask))
+        if mask & SCAN_MASK_FREQ:
+            records['freq'] = self.frequencies()
+        if mask & SCAN_MASK_S11:
+            records['s11'] = 0.5 + 0.1j
+        if mask & SCAN_MASK_S21:
+            records['s21'] = self.s21()
+        header = np.array([mask, self.points], dtype='<u2')
+        return header.tobytes() + records.tobytes()
+
+    def _respond(self, args):
+        if not args:
+            return b''
+
+        if args[0] == 'frequencies':
+            return b''.join(b'%d\r\n' % f for f in self.frequencies())
+
+        if args[0] == 'data':
+            if len(args) > 1 and args[1] == '1':
+                x = self.s21() if self._scanned is None else self._scanned
+            else:
+                x = np.full(self.points, 0.5 + 0.1j)
+            return b''.join(b'%f %f\r\n' % (d.real, d.imag) for d in x)
+
+        if args[0] == 'dump':
+            x = (1000 * np.sin(np.arange(96) / 4)).astype(np.int16)
+            lines = x.astype(np.uint16).reshape(-1, 12)
+            return b''.join(b' '.join(b'%04x' % d for d in line) + b'\r\n'
+                            for line in lines)
+
+        if args[0] == 'sweep' and len(args) == 3:
+            if args[1] == 'start':
+                self.start = float(args[2])
+            elif args[1] == 'stop':
+                self.stop = float(args[2])
+            return b''
+
+        if args[0] == 'scan' and len(args) >= 3:
+            self.start, self.stop = float(args[1]), float(args[2])
+            if len(args) >= 4:
+                self.points = int(args[3])
+            mask = int(args[4]) if len(args) >= 5 else 0
+            if mask & SCAN_MASK_BINARY:
+                return self._binary_scan(mask)
+            # the sweep stays paused on the scanned data
+            self._scanned = self.s21()
+            return b''
+
+        if args[0] == 'resume':
+            self._scanned = None
+            return b''
+
+        return b''
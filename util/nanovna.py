@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 import serial
 import numpy as np
-import pylab as pl
 import struct
 from serial.tools import list_ports
 
@@ -21,13 +20,69 @@ def getport() -> str:
 
 REF_LEVEL = (1 << 9)
 
+# outmask bits of the "scan" command
+SCAN_MASK_FREQ = 0x01
+SCAN_MASK_S11 = 0x02
+SCAN_MASK_S21 = 0x04
+SCAN_MASK_NO_CAL = 0x08
+SCAN_MASK_BINARY = 0x80
+
+# ascii -> hex digit value, -1 for separators
+_HEX_DIGITS = np.full(256, -1, dtype=np.int64)
+_HEX_DIGITS[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(10)
+_HEX_DIGITS[np.frombuffer(b'abcdef', dtype=np.uint8)] = np.arange(10, 16)
+_HEX_DIGITS[np.frombuffer(b'ABCDEF', dtype=np.uint8)] = np.arange(10, 16)
+
+
+# Parsers for whole shell responses. Each one converts the text block in a
+# single numpy pass instead of splitting lines and tokens in python.
+
+def parse_float_block(data):
+    return np.fromstring(data, dtype=np.float64, sep=' ')
+
+
+def parse_complex_block(data):
+    # "re im" pairs are adjacent float64 values, i.e. already complex128
+    return parse_float_block(data).view(np.complex128)
+
+
+def parse_hex_block(data, dtype=np.int16):
+    digit = _HEX_DIGITS[np.frombuffer(data.encode(), dtype=np.uint8)]
+    is_digit = np.concatenate(([0], digit >= 0, [0])).astype(np.int8)
+    edge = np.diff(is_digit)
+    starts, ends = np.flatnonzero(edge == 1), np.flatnonzero(edge == -1)
+    if len(starts) == 0:
+        return np.array([], dtype=dtype)
+    lengths = ends - starts
+    pos = np.flatnonzero(digit >= 0)
+    shift = 4 * (np.repeat(ends, lengths) - pos - 1)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return np.add.reduceat(digit[pos] << shift, offsets).astype(dtype)
+
+
+def scan_record_dtype(mask):
+    # one packed little-endian record per point of a binary scan
+    fields = []
+    if mask & SCAN_MASK_FREQ:
+        fields.append(('freq', '<u4'))
+    if mask & SCAN_MASK_S11:
+        fields.append(('s11', '<c8'))
+    if mask & SCAN_MASK_S21:
+        fields.append(('s21', '<c8'))
+    return np.dtype(fields)
+
 
 class NanoVNA:
     def __init__(self, dev=None):
         self.dev = dev or getport()
         self.serial = None
         self._frequencies = None
+        # frequency axis is only re-read after a sweep-changing command
+        self._frequencies_stale = True
+        self.frequency_fetches_avoided = 0
         self.points = 101
+        # receive buffer reused across reads; bytes past a prompt are kept here
+        self._rxbuf = bytearray()
 
     @property
     def frequencies(self):
@@ -37,6 +92,7 @@ class NanoVNA:
         if points:
             self.points = points
         self._frequencies = np.linspace(start, stop, self.points)
+        self._frequencies_stale = True
 
     def open(self):
         if self.serial is None:
@@ -46,13 +102,38 @@ class NanoVNA:
         if self.serial:
             self.serial.close()
         self.serial = None
+        self._rxbuf = bytearray()
 
     def send_command(self, cmd):
         self.open()
         self.serial.write(cmd.encode())
-        self.serial.readline()  # discard empty line
+        self._read_until(b'\n')  # discard empty line
+
+    def _read_until(self, terminator):
+        # pull whatever the port holds in one call instead of byte by byte
+        buf = self._rxbuf
+        start = 0
+        while True:
+            end = buf.find(terminator, start)
+            if end >= 0:
+                break
+            start = max(0, len(buf) - len(terminator) + 1)
+            buf += self.serial.read(self.serial.in_waiting or 1)
+        end = end + len(terminator)
+        data = bytes(buf[:end])
+        del buf[:end]
+        return data
+
+    def _read_exact(self, size):
+        buf = self._rxbuf
+        while len(buf) < size:
+            buf += self.serial.read(self.serial.in_waiting or 1)
+        data = bytes(buf[:size])
+        del buf[:size]
+        return data
 
     def set_sweep(self, start, stop):
+        self._frequencies_stale = True
         if start is not None:
             self.send_command("sweep start %d\r" % start)
         if stop is not None:
@@ -82,57 +163,31 @@ class NanoVNA:
         self.filter = filter
 
     def fetch_data(self):
-        result = ''
-        line = ''
-        while True:
-            c = self.serial.read().decode('utf-8')
-            if c == chr(13):
-                next  # ignore CR
-            line += c
-            if c == chr(10):
-                result += line
-                line = ''
-                next
-            if line.endswith('ch>'):
-                # stop on prompt
-                break
-        return result
+        data = self._read_until(b'ch>')
+        # drop the prompt line, keep every complete line before it
+        return data[:data.rfind(b'\n') + 1].decode('utf-8')
 
     def fetch_buffer(self, freq=None, buffer=0):
         self.send_command("dump %d\r" % buffer)
-        data = self.fetch_data()
-        x = []
-        for line in data.split('\n'):
-            if line:
-                x.extend([int(d, 16) for d in line.strip().split(' ')])
-        return np.array(x, dtype=np.int16)
+        return parse_hex_block(self.fetch_data())
 
     def fetch_rawwave(self, freq=None):
         if freq:
             self.set_frequency(freq)
             time.sleep(0.05)
         self.send_command("dump 0\r")
-        data = self.fetch_data()
-        x = []
-        for line in data.split('\n'):
-            if line:
-                x.extend([int(d, 16) for d in line.strip().split(' ')])
-        return np.array(x[0::2], dtype=np.int16), np.array(x[1::2], dtype=np.int16)
+        x = parse_hex_block(self.fetch_data())
+        return x[0::2], x[1::2]
 
     def fetch_array(self, sel):
         self.send_command("data %d\r" % sel)
-        data = self.fetch_data()
-        x = []
-        for line in data.split('\n'):
-            if line:
-                x.extend([float(d) for d in line.strip().split(' ')])
-        return np.array(x[0::2]) + np.array(x[1::2]) * 1j
+        return parse_complex_block(self.fetch_data())
 
     def fetch_gamma(self, freq=None):
         if freq:
             self.set_frequency(freq)
         self.send_command("gamma\r")
-        data = self.serial.readline()
+        data = self._read_until(b'\n')
         d = data.strip().split(' ')
         return (int(d[0])+int(d[1])*1.j)/REF_LEVEL
 
@@ -165,29 +220,46 @@ class NanoVNA:
 
     def data(self, array=0):
         self.send_command("data %d\r" % array)
-        data = self.fetch_data()
-        x = []
-        for line in data.split('\n'):
-            if line:
-                d = line.strip().split(' ')
-                x.append(float(d[0])+float(d[1])*1.j)
-        return np.array(x)
-
-    def fetch_frequencies(self):
+        return parse_complex_block(self.fetch_data())
+
+    def fetch_frequencies(self, force=False):
+        if not (force or self._frequencies_stale or self._frequencies is None):
+            self.frequency_fetches_avoided = self.frequency_fetches_avoided + 1
+            return self._frequencies
         self.send_command("frequencies\r")
-        data = self.fetch_data()
-        x = []
-        for line in data.split('\n'):
-            if line:
-                x.append(float(line))
-        self._frequencies = np.array(x)
+        self._frequencies = parse_float_block(self.fetch_data())
+        self._frequencies_stale = False
+        return self._frequencies
 
     def send_scan(self, start=1e6, stop=900e6, points=None):
+        self._frequencies_stale = True
         if points:
             self.send_command("scan %d %d %d\r" % (start, stop, points))
         else:
             self.send_command("scan %d %d\r" % (start, stop))
 
+    def scan_binary(self, start, stop, points=None, mask=SCAN_MASK_FREQ | SCAN_MASK_S21):
+        # one round-trip returning a record array with the fields selected by mask
+        self.request_scan_binary(start, stop, points, mask)
+        return self.read_scan_binary()
+
+    def request_scan_binary(self, start, stop, points=None, mask=SCAN_MASK_FREQ | SCAN_MASK_S21):
+        points = points or self.points
+        mask = mask | SCAN_MASK_BINARY
+        self._frequencies_stale = True
+        self.send_command("scan %d %d %d %d\r" % (start, stop, points, mask))
+
+    def read_scan_binary(self):
+        out_mask, out_points = np.frombuffer(self._read_exact(4), dtype='<u2')
+        dtype = scan_record_dtype(out_mask)
+        records = np.frombuffer(
+            self._read_exact(int(out_points) * dtype.itemsize), dtype=dtype)
+        self.fetch_data()  # discard prompt
+        self._frequencies_stale = not (out_mask & SCAN_MASK_FREQ)
+        if out_mask & SCAN_MASK_FREQ:
+            self._frequencies = records['freq'].astype(np.float64)
+        return records
+
     def scan(self):
         segment_length = 101
         array0 = []
@@ -212,7 +284,7 @@ class NanoVNA:
     def capture(self):
         from PIL import Image
         self.send_command("capture\r")
-        b = self.serial.read(320 * 240 * 2)
+        b = self._read_exact(320 * 240 * 2)
         x = struct.unpack(">76800H", b)
         # convert pixel format from 565(RGB) to 8888(RGBA)
         arr = np.array(x, dtype=np.uint32)
@@ -221,16 +293,19 @@ class NanoVNA:
         return Image.frombuffer('RGBA', (320, 240), arr, 'raw', 'RGBA', 0, 1)
 
     def logmag(self, x):
+        import pylab as pl
         pl.grid(True)
         pl.xlim(self.frequencies[0], self.frequencies[-1])
         pl.plot(self.frequencies, 20*np.log10(np.abs(x)))
 
     def linmag(self, x):
+        import pylab as pl
         pl.grid(True)
         pl.xlim(self.frequencies[0], self.frequencies[-1])
         pl.plot(self.frequencies, np.abs(x))
 
     def phase(self, x, unwrap=False):
+        import pylab as pl
         pl.grid(True)
         a = np.angle(x)
         if unwrap:
@@ -241,30 +316,35 @@ class NanoVNA:
         pl.plot(self.frequencies, np.rad2deg(a))
 
     def delay(self, x):
+        import pylab as pl
         pl.grid(True)
         delay = -np.unwrap(np.angle(x)) / (2*np.pi*np.array(self.frequencies))
         pl.xlim(self.frequencies[0], self.frequencies[-1])
         pl.plot(self.frequencies, delay)
 
     def groupdelay(self, x):
+        import pylab as pl
         pl.grid(True)
         gd = np.convolve(np.unwrap(np.angle(x)), [1, -1], mode='same')
         pl.xlim(self.frequencies[0], self.frequencies[-1])
         pl.plot(self.frequencies, gd)
 
     def vswr(self, x):
+        import pylab as pl
         pl.grid(True)
         vswr = (1+np.abs(x))/(1-np.abs(x))
         pl.xlim(self.frequencies[0], self.frequencies[-1])
         pl.plot(self.frequencies, vswr)
 
     def polar(self, x):
+        import pylab as pl
         ax = pl.subplot(111, projection='polar')
         ax.grid(True)
         ax.set_ylim((0, 1))
         ax.plot(np.angle(x), np.abs(x))
 
     def tdr(self, x):
+        import pylab as pl
         pl.grid(True)
         window = np.blackman(len(x))
         NFFT = 256
@@ -277,6 +357,7 @@ class NanoVNA:
         pl.ylabel("magnitude")
 
     def smithd3(self, x):
+        import pylab as pl
         import mpld3
         import twoport as tp
         fig, ax = pl.subplots()
@@ -298,6 +379,7 @@ class NanoVNA:
 
 
 def plot_sample0(samp):
+    import pylab as pl
     N = min(len(samp), 256)
     fs = 48000
     pl.subplot(211)
@@ -310,6 +392,7 @@ def plot_sample0(samp):
 
 
 def plot_sample(ref, samp):
+    import pylab as pl
     N = min(len(samp), 256)
     fs = 48000
     pl.subplot(211)
@@ -324,6 +407,7 @@ def plot_sample(ref, samp):
 
 
 if __name__ == '__main__':
+    import pylab as pl
     from optparse import OptionParser
     parser = OptionParser(usage="%prog: [options]")
     parser.add_option("-r", "--raw", dest="rawwave",
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
+import time
+import argparse
+import tracemalloc
 import deprecation
 
 import numpy as np
-import pandas as pd
 import scipy.signal as sig
 from numpy.lib.stride_tricks import sliding_window_view
 
@@ -21,13 +23,50 @@ def _detect_sensor_peak(diff_data, peak_kind='max_only'):
     return peak_ids
 
 
-def detect_peak_with_polyfit(deg, thres, y, x=None, offset=0.1):
+class PolyBaseline(object):
+    # Least-squares polynomial baseline. The Vandermonde pseudo-inverse of a
+    # frequency window is prepared once, after which every fit is two small
+    # matrix-vector products instead of a full np.polyfit.
+
+    def __init__(self, deg=4, max_windows=8):
+        self.deg = deg
+        self.max_windows = max_windows
+        self._windows = {}
+
+    def _prepare(self, x):
+        windows = self._windows
+        key = (len(x), float(x[0]), float(x[-1]))
+        window = windows.pop(key, None)
+        if window is None:
+            # centre and scale x to keep the Vandermonde matrix well conditioned
+            center, scale = (x[0] + x[-1]) / 2, (x[-1] - x[0]) / 2 or 1
+            vander = np.vander((x - center) / scale, self.deg + 1)
+            window = (vander, np.linalg.pinv(vander))
+            if len(windows) >= self.max_windows:
+                windows.pop(next(iter(windows)))
+        windows[key] = window  # most recently used last
+        return window
+
+    def fit(self, y, x):
+        # y is one sweep (n,) or a stack of sweeps (N, n) on the same x
+        vander, pinv = self._prepare(x)
+        return (y @ pinv.T) @ vander.T
+
+    def invalidate(self):
+        # rebinding keeps a fit running on another thread safe
+        self._windows = {}
+
+
+def detect_peak_with_polyfit(deg, thres, y, x=None, offset=0.1, baseline=None):
     if x is None:
         x = np.arange(0, len(y), 1)
     # calculate S21 curve w/o tiny peaks
-    yn = np.poly1d(np.polyfit(x, y, deg))
+    if baseline is None:
+        yn_x = np.poly1d(np.polyfit(x, y, deg))(x)
+    else:
+        yn_x = baseline.fit(y, x)
     # calculate S21 change
-    raw_diff = y - (yn(x) + offset)
+    raw_diff = y - (yn_x + offset)
     # remove noise
     raw_diff[raw_diff > 0] = 0
     raw_diff[np.abs(raw_diff) <= (offset + thres)] = 0
@@ -35,7 +74,211 @@ def detect_peak_with_polyfit(deg, thres, y, x=None, offset=0.1):
     # detect tiny peak in S21 curve
     peak_ids = _detect_sensor_peak(filtered_diff, peak_kind='max_only')
 
-    return peak_ids, yn(x) + offset, filtered_diff - offset, -(y-yn(x))
+    return peak_ids, yn_x + offset, filtered_diff - offset, -(y-yn_x)
+
+
+class PeakDetector(object):
+    # Stateful detect_peak_with_polyfit writing into preallocated buffers.
+    # Each result lives in a buffer set taken from a pool; hand it back with
+    # release() once the frame is consumed. With track_alloc, tracemalloc
+    # measures the bytes allocated by the in-place stage (alloc_bytes) and by
+    # scipy's peak search (peak_search_alloc_bytes) of the last detect() call.
+
+    def __init__(self, deg=4, offset=0.1, track_alloc=False, peak_kind='max_only'):
+        self.baseline = PolyBaseline(deg)
+        self.deg = deg
+        self.offset = offset
+        # 'max_only': the deepest dip, 'all': every dip (several rings)
+        self.peak_kind = peak_kind
+        self.track_alloc = track_alloc
+        self.alloc_bytes = 0
+        self.peak_search_alloc_bytes = 0
+        self._size = None
+        self._pool = []
+        self._sets = {}
+
+    def _resize(self, n, m):
+        self._size = (n, m)
+        self._pool = []
+        self._sets = {}
+        self._coef = np.empty(m)
+        self._yn = np.empty(n)
+        self._work = np.empty(n)
+        self._mask = np.empty(n, dtype=bool)
+
+    def _take_set(self):
+        # (base, filtered diff, diff) rows of one block; allocated only when
+        # every set is still in use
+        if self._pool:
+            return self._pool.pop()
+        buffers = np.empty((3, self._size[0]))
+        views = (buffers[0], buffers[1], buffers[2])
+        self._sets[id(buffers)] = views
+        return views
+
+    def release(self, base):
+        # base: the baseline array returned by detect()
+        views = self._sets.get(id(base.base))
+        if views is not None and views[0] is base:
+            self._pool.append(views)
+
+    def _alloc_mark(self):
+        if not self.track_alloc:
+            return 0
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def _alloc_since(self, mark):
+        if not self.track_alloc:
+            return 0
+        current, peak = tracemalloc.get_traced_memory()
+        # without reset_peak (python < 3.9) only memory still held is seen
+        return (peak if hasattr(tracemalloc, 'reset_peak') else current) - mark
+
+    def detect(self, thres, y, x, search=None, hold=0.5, baseline=None):
+        # search: slice of x to look for the peak in first. Its peak is kept
+        # while it is at least hold x as deep as the deepest point of the full
+        # span; otherwise (or when it holds none) the full span is searched.
+        # baseline: S21 curve w/o tiny peaks on x, skips the polynomial fit
+        y = np.asarray(y, dtype=np.float64)
+        if baseline is None:
+            vander, pinv = self.baseline._prepare(x)
+        size = (len(y), self.deg + 1)
+        if self._size != size:
+            self._resize(*size)
+
+        mark = self._alloc_mark()
+        base, filtered, diff = self._take_set()
+        yn, raw_diff, mask = self._yn, self._work, self._mask
+
+        if baseline is None:
+            np.dot(pinv, y, out=self._coef)
+            np.dot(vander, self._coef, out=yn)
+        else:
+            np.copyto(yn, baseline)
+        np.add(yn, self.offset, out=base)
+        # raw_diff = y - (yn + offset), positive part and noise removed
+        np.subtract(y, base, out=raw_diff)
+        np.minimum(raw_diff, 0, out=raw_diff)
+        np.abs(raw_diff, out=filtered)
+        np.less_equal(filtered, self.offset + thres, out=mask)
+        np.copyto(filtered, 0, where=mask)
+        self.alloc_bytes = self._alloc_since(mark)
+
+        mark = self._alloc_mark()
+        peak_ids = ()
+        if search is not None:
+            peak_ids = _detect_sensor_peak(filtered[search], peak_kind=self.peak_kind)
+            peak_ids = peak_ids + (search.start or 0)
+            if len(peak_ids) and filtered[peak_ids[0]] < hold * filtered.max():
+                peak_ids = ()
+        if len(peak_ids) == 0:
+            peak_ids = _detect_sensor_peak(filtered, peak_kind=self.peak_kind)
+        self.peak_search_alloc_bytes = self._alloc_since(mark)
+
+        np.subtract(filtered, self.offset, out=filtered)
+        np.subtract(yn, y, out=diff)
+
+        return peak_ids, base, filtered, diff
+
+
+def interpolate_peak(y, i, x, method='parabolic'):
+    # sub-bin position of the peak at bin i: vertex of the parabola through
+    # the peak and its two neighbours. 'lorentzian' fits the parabola to -1/y,
+    # which is exact for a Lorentzian line; 'none' returns the bin itself.
+    if method == 'none' or i <= 0 or i >= len(y) - 1:
+        return float(x[i])
+    y0, y1, y2 = y[i-1], y[i], y[i+1]
+    if method == 'lorentzian' and min(y0, y1, y2) > 0:
+        y0, y1, y2 = -1 / y0, -1 / y1, -1 / y2
+    curvature = y0 - 2 * y1 + y2
+    if curvature >= 0:
+        return float(x[i])
+    delta = 0.5 * (y0 - y2) / curvature
+    return float(x[i] + delta * (x[i+1] - x[i-1]) / 2)
+
+
+def interpolate_peaks(y, ids, x, method='parabolic'):
+    # interpolate_peak over several peak bins at once
+    ids = np.asarray(ids, dtype=np.intp)
+    freq = np.asarray(x, dtype=np.float64)[ids]
+    inner = (ids > 0) & (ids < len(y) - 1)
+    if method == 'none' or not inner.any():
+        return freq
+    i = ids[inner]
+    y0, y1, y2 = y[i-1], y[i], y[i+1]
+    if method == 'lorentzian':
+        positive = (y0 > 0) & (y1 > 0) & (y2 > 0)
+        with np.errstate(divide='ignore'):
+            y0, y1, y2 = (np.where(positive, -1 / v, v) for v in (y0, y1, y2))
+    curvature = y0 - 2 * y1 + y2
+    peaked = curvature < 0
+    delta = np.where(peaked, 0.5 * (y0 - y2) / np.where(peaked, curvature, -1), 0)
+    freq[inner] = freq[inner] + delta * (x[i+1] - x[i-1]) / 2
+    return freq
+
+
+class PeakTracker(object):
+    # Follows the sensor dip from frame to frame. The peak search is seeded
+    # with +-window (MHz) around the previous peak, so a weaker dip elsewhere
+    # does not steal the track; the full span is searched when the window
+    # holds no peak or a much deeper one appears elsewhere. The peak is refined
+    # to a sub-bin frequency (peak_freq, nan while no peak is found). With a
+    # detector finding every dip, the whole span is searched, peak_freq is the
+    # deepest one and peak_freqs holds all of them.
+
+    def __init__(self, detector, window=0.5, method='parabolic', hold=0.5):
+        self.detector = detector
+        self.window = window
+        self.hold = hold
+        self.method = method
+        self.peak_freq = np.nan
+        self.peak_freqs = np.empty(0)
+
+    def reset(self):
+        self.peak_freq = np.nan
+        self.peak_freqs = np.empty(0)
+
+    def track(self, thres, y, x, baseline=None):
+        search = None
+        if self.window > 0 and not np.isnan(self.peak_freq) \
+                and self.detector.peak_kind == 'max_only':
+            search = slice(np.searchsorted(x, self.peak_freq - self.window),
+                           np.searchsorted(x, self.peak_freq + self.window, side='right'))
+
+        peak_ids, base, filtered, diff = self.detector.detect(
+            thres, y, x, search=search, hold=self.hold, baseline=baseline)
+        if len(peak_ids) > 1:
+            self.peak_freqs = interpolate_peaks(diff, peak_ids, x, self.method)
+            self.peak_freq = float(self.peak_freqs[np.argmax(filtered[peak_ids])])
+        else:
+            self.peak_freq = interpolate_peak(diff, peak_ids[0], x, self.method) \
+                if len(peak_ids) else np.nan
+            self.peak_freqs = np.array([self.peak_freq]) if len(peak_ids) else np.empty(0)
+
+        return peak_ids, base, filtered, diff, self.peak_freq
+
+
+def detect_peaks_batch(deg, thres, Y, x=None, offset=0.1, baseline=None, peak_kind='max_only'):
+    # detect_peak_with_polyfit over an (N_frames, N_points) matrix; only the
+    # final peak search runs per row
+    Y = np.asarray(Y, dtype=np.float64)
+    if x is None:
+        x = np.arange(0, Y.shape[1], 1)
+    if baseline is None:
+        baseline = PolyBaseline(deg)
+    yn_x = baseline.fit(Y, x)
+    raw_diff = Y - (yn_x + offset)
+    raw_diff[raw_diff > 0] = 0
+    raw_diff[np.abs(raw_diff) <= (offset + thres)] = 0
+    filtered_diff = np.abs(raw_diff)
+    peak_ids = [_detect_sensor_peak(row, peak_kind=peak_kind)
+                for row in filtered_diff]
+
+    return peak_ids, yn_x + offset, filtered_diff - offset, -(Y-yn_x)
 
 
 def _SMA_sliding_window(data, window_size=3):
@@ -63,6 +306,7 @@ def detect_peak_with_moving_ave(data, method='EMA'):
         ave_data = _SMA_sliding_window(data, window_size=5)
 
     if method == 'EMA':
+        import pandas as pd
         df = pd.DataFrame(data)
         ave_data = df.ewm(com=2).mean().to_numpy().T[0]
 
@@ -75,7 +319,43 @@ def detect_peak_with_moving_ave(data, method='EMA'):
 
 
 def main(argv):
-    pass
+    # reprocess a recorded S21 log or capture in batches of --chunk frames
+    from util.s21_log import open_log
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("logpath", help="S21 log (.npy) or capture (.npz)")
+    parser.add_argument("-t", "--thres", type=float, default=0.03)
+    parser.add_argument("-c", "--chunk", type=int, default=1024,
+                        help="frames detected per batch")
+    parser.add_argument("-o", "--output", help="save peaks and baselines (.npz)")
+    args = parser.parse_args(argv[1:])
+
+    log = open_log(args.logpath)
+    freq, frames = log.freq, log.frames
+    peak_freq = np.full(frames, np.nan)
+    if args.output:
+        base_dB, filtered_diff_dB, diff_dB = np.empty((3, frames, len(freq)))
+
+    elapsed = 0.0
+    for lo in range(0, frames, args.chunk):
+        hi = min(lo + args.chunk, frames)
+        Y = np.array([log.row(i) for i in range(lo, hi)], dtype=np.float64)
+        st = time.time()
+        peak_ids, base, filtered, diff = detect_peaks_batch(deg=4, thres=args.thres, Y=Y, x=freq)
+        elapsed = elapsed + time.time() - st
+        peak_freq[lo:hi] = [interpolate_peak(row, ids[0], freq) if len(ids) else np.nan
+                            for ids, row in zip(peak_ids, diff)]
+        if args.output:
+            base_dB[lo:hi], filtered_diff_dB[lo:hi], diff_dB[lo:hi] = base, filtered, diff
+    log.close()
+
+    print("{} frames in {:.3f} s ({:.0f} frames/s), peak found in {} frames".format(
+        frames, elapsed, frames / elapsed if elapsed > 0 else 0,
+        np.count_nonzero(~np.isnan(peak_freq))))
+
+    if args.output:
+        np.savez(args.output, freq=freq, peak_freq=peak_freq, base_dB=base_dB,
+                 diff_dB=diff_dB, filtered_diff_dB=filtered_diff_dB)
 
 
 if __name__ == '__main__':
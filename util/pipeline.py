@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import csv
+import json
+import time
+import socket
+import argparse
+from collections import namedtuple
+from configparser import ConfigParser
+
+import numpy as np
+
+from util.peak_detector import PeakDetector, PeakTracker
+from util.state_classifier import StateClassifier
+from util.state_events import StateEvent, StateEventEngine
+from util.nanovna import NanoVNA
+from util.acquisition import NanoVNASweeper
+from util.replay import LogReplayer, StageStats, replay_speed
+
+# sensor sections an ini may hold, in the order of the sensor viewer
+SENSORS = ('switch', 'slider', 'joystick', 'scroll', 'mouse')
+
+# time (s) is the recorded time of a replayed frame and the request time of
+# a sweep; peak_freq (MHz) is nan and peak_freqs empty while no peak is
+# found; states ({sensor: state}) keep the last classified peak, None until
+# the first one; events are the StateEvents of the frame
+PipelineFrame = namedtuple('PipelineFrame', 'index time peak_freq peak_freqs states events')
+
+FRAME_FIELDS = ('index', 'time', 'peak_freq', 'peaks')
+EVENT_FIELDS = StateEvent._fields
+
+
+# Frames of an S21 log or capture, paced by a LogReplayer.
+class ReplaySource(object):
+
+    def __init__(self, replayer):
+        self.replayer = replayer
+        self.freq = replayer.freq
+
+    @property
+    def waited(self):
+        return self.replayer.waited
+
+    def read(self):
+        # (index, time, freq, dB), None at the end of the log
+        frame = self.replayer.read()
+        if frame is None:
+            return None
+        index, freq, dB = frame
+        return index, self.replayer.frame_time(index), freq, dB
+
+    def close(self):
+        self.replayer.close()
+
+
+# Full-span sweeps of a NanoVNA, set up like QtVNA does from the [VNA]
+# section (start_freq, freq_step, step_num, transfer, pipeline).
+class VNASource(object):
+
+    def __init__(self, vna, start_freq, freq_step, step_num, transfer='ascii', pipeline=False):
+        # start_freq, freq_step: MHz
+        self.vna = vna
+        end_freq = start_freq + freq_step * (step_num - 1)
+        self.freq = np.arange(start_freq, end_freq + freq_step/2, freq_step)
+        self.vna.set_frequencies(start_freq*1e6, end_freq*1e6, step_num)
+        self.vna.set_sweep(start_freq*1e6, end_freq*1e6)
+        self.sweeper = NanoVNASweeper(self.vna, start_freq*1e6, end_freq*1e6, step_num,
+                                      transfer=transfer, pipeline=pipeline)
+        self.waited = 0.0
+        self._index = 0
+
+    @classmethod
+    def from_parser(cls, parser, vna=None):
+        return cls(vna if vna is not None else NanoVNA(),
+                   parser.getfloat('VNA', 'start_freq'), parser.getfloat('VNA', 'freq_step'),
+                   parser.getint('VNA', 'step_num'),
+                   transfer=parser.get('VNA', 'transfer', fallback='ascii'),
+                   pipeline=parser.getboolean('VNA', 'pipeline', fallback=False))
+
+    def read(self):
+        s21 = self.sweeper.sweep()
+        index, self._index = self._index, self._index + 1
+        return index, self.sweeper.requested_at, self.freq, \
+            20 * np.log10(np.abs(s21), dtype=np.float64)
+
+    def close(self):
+        self.sweeper.drain()
+        self.vna.close()
+
+
+# The acquisition -> detection -> classification chain of QtVNA and the
+# sensor viewer as a plain object: no Qt, no display. step() runs one frame
+# through it; run() streams frames to sinks (TextSink, CsvSink, UdpSink).
+# span (MHz) limits the detection to part of the sweep, like the frequency
+# range slider of the GUI.
+class Pipeline(object):
+
+    def __init__(self, source, tracker, classifier=None, events=None, thres=0.03, span=None):
+        self.source = source
+        self.tracker = tracker
+        self.classifier = classifier
+        self.events = events
+        self.thres = thres
+        self.span = span
+        self.sensors = classifier.sensors if classifier is not None else []
+        self.states = None
+        self.stats = StageStats()
+        self._target_freq, self._target_ids = None, None
+
+    @classmethod
+    def from_parser(cls, parser, source, thres=0.03, span=None, events=True):
+        # detector, tracker, sensors and events as set in the ini
+        detector = PeakDetector(deg=4, peak_kind=parser.get(
+            'detector', 'peak_kind', fallback='max_only'))
+        tracker = PeakTracker(detector,
+                              window=parser.getfloat('detector', 'track_window', fallback=0.5),
+                              method=parser.get('detector', 'refine', fallback='parabolic'))
+        sensors = [sensor for sensor in SENSORS if parser.has_section(sensor)]
+        classifier = StateClassifier.from_parser(parser, sensors) if sensors else None
+        engine = StateEventEngine.from_parser(parser) if events else None
+        if span is not None and not (span[0] <= source.freq[-1] and span[1] >= source.freq[0]):
+            raise ValueError("span {:g}-{:g} MHz is outside the sweep ({:g}-{:g} MHz)".format(
+                span[0], span[1], source.freq[0], source.freq[-1]))
+        return cls(source, tracker, classifier, engine, thres=thres, span=span)
+
+    def _targetIds(self, freq):
+        # slice of the sorted axis inside span, rebuilt when the axis changes
+        if freq is self._target_freq:
+            return self._target_ids
+        if self.span is None:
+            ids = slice(0, len(freq))
+        else:
+            ids = np.flatnonzero((freq >= self.span[0]) & (freq <= self.span[1]))
+            ids = slice(ids[0], ids[-1] + 1) if len(ids) else slice(0, 0)
+        self._target_freq, self._target_ids = freq, ids
+        return ids
+
+    def step(self):
+        # one frame through the chain, None once the source is exhausted
+        st = time.perf_counter()
+        frame = self.source.read()
+        if frame is None:
+            return None
+        index, t, freq, dB = frame
+        rt = time.perf_counter()
+
+        ids = self._targetIds(freq)
+        if ids.stop > ids.start:
+            peaks, base, _, _, peak_freq = self.tracker.track(self.thres, y=dB[ids], x=freq[ids])
+            self.tracker.detector.release(base)
+        else:
+            # no bin of this sweep inside span: nothing to detect
+            peaks, peak_freq = [], np.nan
+            self.tracker.reset()
+        dt = time.perf_counter()
+
+        if self.classifier is not None and len(peaks):
+            self.states = self.classifier.sensor_states(self.tracker.peak_freqs)
+        events = []
+        if self.events is not None:
+            events = self.events.tick(t) if self.states is None \
+                else self.events.update(self.states, t)
+        et = time.perf_counter()
+
+        self.stats.add('wait', self.source.waited)
+        self.stats.add('read', rt - st - self.source.waited)
+        self.stats.add('detect', dt - rt)
+        self.stats.add('classify', et - dt)
+        self.stats.frame()
+        return PipelineFrame(index, t, peak_freq, self.tracker.peak_freqs.copy(),
+                             self.states, events)
+
+    def frame_record(self, frame):
+        # flat dict of a frame: FRAME_FIELDS and the state of every sensor
+        record = {'index': int(frame.index), 'time': float(frame.time),
+                  'peak_freq': None if np.isnan(frame.peak_freq) else float(frame.peak_freq),
+                  'peaks': len(frame.peak_freqs)}
+        for sensor in self.sensors:
+            record[sensor] = frame.states[sensor] if frame.states is not None else None
+        return record
+
+    def fields(self, output='frames'):
+        return list(EVENT_FIELDS) if output == 'events' else list(FRAME_FIELDS) + self.sensors
+
+    def run(self, sinks=(), frames=None, output='frames'):
+        # output: 'frames' (every frame), 'changes' (frames whose states
+        # changed) or 'events' (debounced StateEvents)
+        shown = None
+        while frames is None or self.stats.frames < frames:
+            frame = self.step()
+            if frame is None:
+                break
+            st = time.perf_counter()
+            if output == 'events':
+                records = [event._asdict() for event in frame.events]
+            elif output == 'changes' and frame.states == shown:
+                records = []
+            else:
+                shown = frame.states
+                records = [self.frame_record(frame)]
+            for record in records:
+                for sink in sinks:
+                    sink.write(record)
+            self.stats.add('output', time.perf_counter() - st)
+        return self.stats
+
+    def close(self):
+        self.source.close()
+
+
+def _format(value):
+    if isinstance(value, float):
+        return '{:.4f}'.format(value)
+    return str(value)
+
+
+# One 'field=value ...' line per record.
+class TextSink(object):
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+
+    def write(self, record):
+        self.stream.write(' '.join('{}={}'.format(key, _format(value))
+                                   for key, value in record.items()) + '\n')
+
+    def close(self):
+        self.stream.flush()
+
+
+# One CSV row per record under a header of fields; path '-' is stdout.
+class CsvSink(object):
+
+    def __init__(self, path, fields):
+        self._file = sys.stdout if path == '-' else open(path, 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fields)
+        self._writer.writeheader()
+
+    def write(self, record):
+        self._writer.writerow(record)
+
+    def close(self):
+        if self._file is sys.stdout:
+            self._file.flush()
+        else:
+            self._file.close()
+
+
+# One JSON datagram per record to host:port; a receiver that is slow or
+# not listening never stalls the pipeline.
+class UdpSink(object):
+
+    def __init__(self, address):
+        host, port = address.rsplit(':', 1)
+        self.address = (host, int(port))
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def write(self, record):
+        self._socket.sendto(json.dumps(record).encode(), self.address)
+
+    def close(self):
+        self._socket.close()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="run the detection pipeline on a NanoVNA or a log without Qt")
+    parser.add_argument("-i", "--inipath", default='setting/default.ini')
+    parser.add_argument("-f", "--logpath", help="replay an S21 log (.npy/.npz) "
+                        "instead of sweeping the NanoVNA")
+    parser.add_argument("-m", "--mode", default='realtime',
+                        help="replay pace: realtime, fast or Nx (N times real time)")
+    parser.add_argument("-s", "--start-frame", type=int, default=0)
+    parser.add_argument("-n", "--frames", type=int, help="stop after this many frames")
+    parser.add_argument("-t", "--thres", type=float, default=0.03)
+    parser.add_argument("--span", type=float, nargs=2, metavar=('START', 'END'),
+                        help="detect the peak between START and END (MHz) only")
+    parser.add_argument("-e", "--output", default='frames', choices=('frames', 'changes', 'events'),
+                        help="every frame, frames whose sensor states changed, or state events")
+    parser.add_argument("-o", "--csv", help="write CSV to this path ('-': stdout)")
+    parser.add_argument("-u", "--udp", help="send JSON datagrams to host:port")
+    args = parser.parse_args(argv[1:])
+
+    ini = ConfigParser()
+    ini.read(args.inipath)
+    if args.logpath:
+        source = ReplaySource(LogReplayer(args.logpath, speed=replay_speed(args.mode),
+                                          start=args.start_frame, loop=False))
+    else:
+        source = VNASource.from_parser(ini)
+    try:
+        pipeline = Pipeline.from_parser(ini, source, thres=args.thres, span=args.span)
+    except ValueError as e:
+        source.close()
+        parser.error(str(e))
+
+    fields = pipeline.fields(args.output)
+    sinks = []
+    if args.csv:
+        sinks.append(CsvSink(args.csv, fields))
+    if args.udp:
+        sinks.append(UdpSink(args.udp))
+    if not sinks:
+        sinks.append(TextSink())
+
+    try:
+        pipeline.run(sinks, frames=args.frames, output=args.output)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.close()
+        for sink in sinks:
+            sink.close()
+    # the report goes to stderr, so it does not mix with CSV on stdout
+    print(pipeline.stats.report(), file=sys.stderr)
+    if args.logpath:
+        print('replay ({}): {} late frames'.format(args.mode, source.replayer.late),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
+    sys.exit()
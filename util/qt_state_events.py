@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+
+from PyQt5.QtCore import *
+
+from util.state_events import StateEventEngine
+
+
+# Qt front of StateEventEngine: update() takes the sensor_info of every frame
+# or only of the frames where it changed, a timer accepts debounced states and
+# keeps hold/long_press events coming in between, and every event is emitted
+# once on event_signal.
+class QtStateEvents(QObject):
+
+    event_signal = pyqtSignal(object)
+
+    def __init__(self, engine=None, tick=0.01, parent=None):
+        super().__init__(parent)
+        self.engine = engine if engine is not None else StateEventEngine()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._tick)
+        self.timer.setInterval(int(tick * 1000))
+        self.timer.start()
+
+    @classmethod
+    def from_parser(cls, parser, parent=None):
+        return cls(StateEventEngine.from_parser(parser),
+                   tick=parser.getfloat('event', 'tick', fallback=0.01), parent=parent)
+
+    def reset(self):
+        self.engine.reset()
+
+    def update(self, sensor_info):
+        for event in self.engine.update(sensor_info):
+            self.event_signal.emit(event)
+
+    def _tick(self):
+        for event in self.engine.tick():
+            self.event_signal.emit(event)
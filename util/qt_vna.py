@@ -2,6 +2,7 @@
 import os
 import sys
 import time
+import threading
 from configparser import ConfigParser
 
 import numpy as np
@@ -13,6 +14,9 @@ from superqt import QLabeledDoubleRangeSlider
 
 from util.peak_detector import *
 from util.nanovna import NanoVNA
+from util.acquisition import FrameMailbox, AcquisitionWorker, NanoVNASweeper, \
+    RoiSweepPlanner
+from util.replay import LogReplayer, StageStats, replay_speed
 
 
 class QtVNA(QWidget):
@@ -20,14 +24,34 @@ class QtVNA(QWidget):
     s21_signal = pyqtSignal(object)
     peak_signal = pyqtSignal(object)
 
-    def __init__(self, parent=None, inifile=None, logfile=None):
+    def __init__(self, parent=None, inifile=None, logfile=None, log_start=0,
+                 replay_mode='realtime'):
         super().__init__(parent)
 
         self.s21_data = None
         self.is_running = False
+        self.mailbox = FrameMailbox()
+        self.worker = None
+        self.detector = PeakDetector(deg=4)
+        self.tracker = PeakTracker(self.detector)
+        self.sweep_mode = 'full'
+        self.planner = None
+        self.target_ids = None
+        self._target_freq, self._target_range = None, None
+        # range set by the slider, applied by the worker before its next frame
+        self._pending_range = None
+        self._range_lock = threading.Lock()
+        self.peak_data = [None, None, None, None, None]
 
         self.inifile = inifile
         self.logfile = logfile
+        # replay starts at this frame; seekLog() jumps while replaying.
+        # replay_mode: realtime, fast or Nx (see util.replay.replay_speed)
+        self.log_start = log_start
+        self.replay_mode = replay_mode
+        self.replayer = None
+        # per-stage latency of the frames, printed on stop
+        self.stats = StageStats()
 
         self.font = QFont('Arial', 10)
         self.logfont = QFont('Arial', 10)
@@ -90,8 +114,17 @@ class QtVNA(QWidget):
         else:
             self._initPicoVNA()
         time.sleep(1)
+        self.stats = StageStats()
         self.is_running = True
 
+        parser = ConfigParser()
+        parser.read(self.inifile)
+        self.detector.track_alloc = parser.getboolean(
+            'detector', 'track_alloc', fallback=False)
+        self.detector.peak_kind = parser.get('detector', 'peak_kind', fallback='max_only')
+        self.tracker.method = parser.get('detector', 'refine', fallback='parabolic')
+        self.tracker.window = parser.getfloat('detector', 'track_window', fallback=0.5)
+
         self.freq_range_slider.setRange(self.start_freq, self.end_freq)
         self.freq_range_slider.setSingleStep(self.freq_step)
         self.freq_range_slider.setValue((self.start_freq, self.end_freq))
@@ -99,16 +132,27 @@ class QtVNA(QWidget):
         self.freq_range_slider.valueChanged.connect(
             lambda range: self.setFreqRange(range))
 
+        # sweeps run back-to-back off the GUI thread; replay is paced by the replayer
+        self.worker = AcquisitionWorker(
+            self.acquire, self.mailbox, release=self._releaseFrame)
+        self.worker.start()
+
     def _initLogVNA(self):
-        self.S21_log_data = np.load(self.logfile)
-        self.log_viewer.appendPlainText("Replaying {}".format(self.logfile))
-        self.freq = self.S21_log_data[0]
+        # memory-mapped: rows are read from disk as they are replayed
+        self.replayer = LogReplayer(self.logfile, speed=replay_speed(self.replay_mode),
+                                    start=self.log_start)
+        self.log_viewer.appendPlainText("Replaying {} ({} frames, {})".format(
+            self.logfile, self.replayer.frames, self.replay_mode))
+        self.freq = self.full_freq = self.replayer.freq
         self.start_freq = self.now_start_freq = self.freq[0]
         self.end_freq = self.now_end_freq = self.freq[-1]
         self.freq_step = self.freq[1] - self.freq[0]
         self.step_num = len(self.freq)
-        self.log_cnt = 1
-        self.MAX_LOG_CNT = len(self.S21_log_data)
+
+    def seekLog(self, frame):
+        # replay continues from frame (0 is the first frame after the freq
+        # row); taken up by the acquisition thread before its next read
+        self.replayer.seek(frame)
 
 
     def _initZNBVNA(self):
@@ -159,15 +203,30 @@ class QtVNA(QWidget):
         self.step_num = self.parser.getint('VNA', 'step_num')
         self.input_power = self.parser.getint('VNA', 'input_power')
         self.bandwidth = self.parser.getint('VNA', 'bandwidth')
+        self.transfer = self.parser.get('VNA', 'transfer', fallback='ascii')
+        self.pipeline = self.parser.getboolean('VNA', 'pipeline', fallback=False)
+        self.sweep_mode = self.parser.get('VNA', 'sweep_mode', fallback='full')
         self.end_freq = self.now_end_freq = self.start_freq + \
             self.freq_step * (self.step_num - 1)
-        self.freq = np.arange(
+        self.freq = self.full_freq = np.arange(
             self.start_freq, self.end_freq + self.freq_step/2, self.freq_step)
 
         self.vna = NanoVNA()
         self.vna.set_frequencies(
             self.start_freq*1e6, self.end_freq*1e6, self.step_num)
         self.vna.set_sweep(self.start_freq*1e6, self.end_freq*1e6)
+        self.sweeper = NanoVNASweeper(self.vna, self.start_freq*1e6, self.end_freq*1e6,
+                                      self.step_num, transfer=self.transfer, pipeline=self.pipeline,
+                                      scan=self.sweep_mode == 'roi')
+        if self.sweep_mode == 'roi':
+            # coarse full-span sweeps alternating with dense sweeps around the peak
+            self.planner = RoiSweepPlanner(
+                self.start_freq*1e6, self.end_freq*1e6,
+                coarse_points=self.parser.getint('VNA', 'coarse_points', fallback=26),
+                roi_points=self.parser.getint('VNA', 'roi_points', fallback=26),
+                roi_width=self.parser.getfloat('VNA', 'roi_width', fallback=0.6)*1e6,
+                coarse_every=self.parser.getint('VNA', 'coarse_every', fallback=8))
+            self.sweeper.retune(*self.planner.coarse_span)
         # load calibration file
         # ans = self.vna.LoadCal(
         #    self.parser.get('VNA', 'calibration_file'))
@@ -186,14 +245,31 @@ class QtVNA(QWidget):
         target_start_freq, target_end_freq = freq_range
         start_id = 0
         end_id = self.step_num - 1
-        if np.where(self.freq >= target_start_freq)[0].size != 0:
-            start_id = np.where(self.freq >= target_start_freq)[0][0]
-        if np.where(self.freq >= target_end_freq)[0].size != 0:
-            end_id = np.where(self.freq >= target_end_freq)[0][0]
-
-        self.now_start_freq = self.start_freq + self.freq_step * start_id
-        self.now_end_freq = self.end_freq - \
-            self.freq_step * (self.step_num - 1 - end_id)
+        if np.where(self.full_freq >= target_start_freq)[0].size != 0:
+            start_id = np.where(self.full_freq >= target_start_freq)[0][0]
+        if np.where(self.full_freq >= target_end_freq)[0].size != 0:
+            end_id = np.where(self.full_freq >= target_end_freq)[0][0]
+
+        # runs on the GUI thread while the worker detects: the worker picks
+        # the range up in acquire()
+        with self._range_lock:
+            self._pending_range = (
+                self.start_freq + self.freq_step * start_id,
+                self.end_freq - self.freq_step * (self.step_num - 1 - end_id))
+
+    def _applyFreqRange(self):
+        # runs on the acquisition worker thread, between two frames
+        with self._range_lock:
+            freq_range, self._pending_range = self._pending_range, None
+        if freq_range is None:
+            return
+        self.now_start_freq, self.now_end_freq = freq_range
+        # target ids change, so the prepared baseline window is stale
+        self.detector.baseline.invalidate()
+        if self.planner is not None:
+            # the planned narrow sweep may lie outside the new range
+            self.planner.set_span(self.now_start_freq*1e6, self.now_end_freq*1e6)
+            self.sweeper.retune(*self.planner.coarse_span)
 
     def setThres(self, thres_range):
         _, thres = thres_range
@@ -202,15 +278,20 @@ class QtVNA(QWidget):
     def _getRawS21(self):
         # Get S21 data from log file during replaying mode
         if self.logfile:
-            self.log_cnt = self.log_cnt % self.MAX_LOG_CNT
-            self.raw_dB = self.S21_log_data[self.log_cnt]
-            self.log_cnt = self.log_cnt + 1
+            frame = self.replayer.read()
+            if frame is None:
+                # closed while waiting for the frame
+                return self.freq, None
+            _, _, self.raw_dB = frame
+            self.stats.add('wait', self.replayer.waited)
             return self.freq, self.raw_dB
 
         # Get S21 data from PicoVNA
-        self.vna.fetch_frequencies()
-        s21 = self.vna.data(1)
-        dB = 20 * np.log10(np.abs(s21))
+        s21 = self.sweeper.sweep()
+        dB = 20 * np.log10(np.abs(s21), dtype=np.float64)
+        if self.sweep_mode == 'roi':
+            # the span changes from sweep to sweep
+            return self.sweeper.freq / 1e6, dB
         return self.freq, dB
 
     def setupEnhance(self, smoo=1, bw=10000, ave=1):
@@ -239,33 +320,124 @@ class QtVNA(QWidget):
     def stop(self):
         print("close VNA")
         self.is_running = False
+        if self.replayer is not None:
+            self.replayer.close()
+        worker_exited = True
+        if self.worker is not None:
+            self.worker.stop()
+            worker_exited = not self.worker.is_alive()
+            if not worker_exited:
+                # still inside a sweep: the VNA is left to it
+                print("acquisition worker did not exit; the VNA is not drained")
+            errors, self.worker = self.worker.errors, None
+            print("frames dropped before display: {}".format(
+                self.mailbox.dropped))
+            if errors:
+                print("frames failed: {}".format(errors))
+            if self.stats.frames:
+                print(self.stats.report())
+            if self.replayer is not None:
+                print("replay ({}): {} late frames".format(
+                    self.replay_mode, self.replayer.late))
+        if self.detector.track_alloc:
+            print("bytes allocated per frame: detector {}, peak search {}".format(
+                self.detector.alloc_bytes, self.detector.peak_search_alloc_bytes))
         time.sleep(0.1)
-        if self.logfile == None:
+        if self.logfile == None and self.vna is not None:
+            if worker_exited:
+                self.sweeper.drain()
+            print("frequency fetches avoided: {}".format(
+                self.vna.frequency_fetches_avoided))
+            if self.planner is not None:
+                print("coarse sweeps: {}, roi sweeps: {}".format(
+                    self.planner.coarse_sweeps, self.planner.roi_sweeps))
+                if worker_exited:
+                    self.vna.resume()
             del self.vna
+            self.vna = None
 
-    def update(self, print_time=False):
+    def acquire(self, print_time=False):
+        # runs on the acquisition worker thread
         if not self.is_running:
-            return
+            return None
 
+        self._applyFreqRange()
         st = time.time()
         self.freq, self.dB = self._getRawS21()
-
-        self.target_ids = np.where(
-            (self.freq >= self.now_start_freq) & (self.freq <= self.now_end_freq))
+        if self.dB is None:
+            return None
+        if self.replayer is not None:
+            # the frame starts once it is due, not while it is waited for
+            st = st + self.replayer.waited
+
+        self._updateTargetIds()
+        if self.target_ids.stop <= self.target_ids.start:
+            # a sweep requested before the range moved away from its span;
+            # the next one covers the new range
+            if self.planner is not None:
+                self.sweeper.retune(*self.planner.coarse_span)
+            return None
         mt = time.time()
 
-        self.peaks, self.base_dB, self.diff_dB_w_filter, self.diff_dB = detect_peak_with_polyfit(
-            deg=4, thres=self.thres, y=self.dB[self.target_ids], x=self.freq[self.target_ids])
+        x = self.freq[self.target_ids]
+        baseline = None if self.planner is None else \
+            self.planner.baseline(self.sweeper.span, x)
+        if baseline is not None:
+            baseline -= self.detector.offset
+        self.peaks, self.base_dB, self.diff_dB_w_filter, self.diff_dB, self.peak_freq = \
+            self.tracker.track(self.thres, y=self.dB[self.target_ids], x=x, baseline=baseline)
+        # whether the sweep covers the whole span (every sweep unless roi)
+        full_span = self.planner is None or self.planner.is_coarse(self.sweeper.span)
+        if self.planner is not None:
+            self.sweeper.retune(*self.planner.update(
+                self.sweeper.span, x, self.base_dB, self.peak_freq*1e6))
         et = time.time()
+        self.stats.add('read', mt - st)
+        self.stats.add('detect', et - mt)
         if print_time:
             print("getRawS21: {:.0f}ms, detectPeak: {:.0f}ms".format(
                 (mt-st)*1e3, (et-mt)*1e3))
 
         self.fps = 1/(et-st) if et - st > 0 else 1000
-        self.s21_data = [self.freq, self.dB, self.base_dB, self.diff_dB,
-                         self.diff_dB_w_filter, self.peaks, self.fps, self.target_ids, self.thres]
+        return [self.freq, self.dB, self.base_dB, self.diff_dB, self.diff_dB_w_filter,
+                self.peaks, self.fps, self.target_ids, self.thres, st, self.peak_freq,
+                self.tracker.peak_freqs, full_span]
+
+    def _updateTargetIds(self):
+        # the target window is a slice of the sorted axis, rebuilt only on change
+        target_range = (self.now_start_freq, self.now_end_freq)
+        if self.freq is self._target_freq and target_range == self._target_range:
+            return
+        ids = np.flatnonzero(
+            (self.freq >= self.now_start_freq) & (self.freq <= self.now_end_freq))
+        self.target_ids = slice(ids[0], ids[-1] + 1) if len(ids) else slice(0, 0)
+        self._target_freq, self._target_range = self.freq, target_range
+
+    def _releaseFrame(self, frame):
+        self.detector.release(frame[2])
+
+    def update(self):
+        # runs on the GUI thread; publishes the newest frame, never waits for the device
+        frame = self.mailbox.take()
+        if frame is None:
+            return
+
+        # copy the detector buffers into arrays of this frame alone and hand
+        # them back to the pool; a frame waiting in the render scheduler and
+        # the plots keep references to the arrays they are given
+        published = np.array(frame[2:5], dtype=np.float64)
+        self._releaseFrame(frame)
+        frame[2], frame[3], frame[4] = published
+
+        # from the start of the sweep to the GUI
+        self.stats.add('deliver', time.time() - frame[9])
+        self.stats.frame()
+
+        self.s21_data = frame
+        self.peak_data[0], self.peak_data[1], self.peak_data[2] = frame[0], frame[5], frame[7]
+        self.peak_data[3], self.peak_data[4] = frame[10], frame[11]
         self.s21_signal.emit(self.s21_data)
-        self.peak_signal.emit([self.freq, self.peaks, self.target_ids])
+        self.peak_signal.emit(self.peak_data)
 
     def _detectNearMetal(self):
         pass
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+
+from PyQt5.QtCore import *
+
+
+# Draws the newest submitted frame at most fps_cap times per second.
+# Frames submitted between two draws are coalesced into the newest one.
+class RenderScheduler(QObject):
+
+    def __init__(self, render, fps_cap=60, parent=None):
+        super().__init__(parent)
+        self.render = render
+        self._frame = None
+
+        self.received = 0
+        self.drawn = 0
+        self.coalesced = 0
+        self.draw_fps = 0
+        # time (s) spent in render, smoothed like draw_fps
+        self.draw_time = 0
+        self._last_draw = None
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._tick)
+        self.setFpsCap(fps_cap)
+        self.timer.start()
+
+    def setFpsCap(self, fps_cap):
+        # 0 draws on every pass of the event loop
+        self.fps_cap = fps_cap
+        self.timer.setInterval(int(1000 / fps_cap) if fps_cap > 0 else 0)
+
+    def submit(self, frame):
+        if self._frame is not None:
+            self.coalesced = self.coalesced + 1
+        self._frame = frame
+        self.received = self.received + 1
+
+    def _tick(self):
+        frame, self._frame = self._frame, None
+        if frame is None:
+            return
+
+        now = time.time()
+        if self._last_draw is not None and now > self._last_draw:
+            fps = 1 / (now - self._last_draw)
+            self.draw_fps = fps if self.drawn < 2 else 0.9 * self.draw_fps + 0.1 * fps
+        self._last_draw = now
+
+        st = time.perf_counter()
+        self.render(frame)
+        elapsed = time.perf_counter() - st
+        self.draw_time = elapsed if self.drawn < 2 else 0.9 * self.draw_time + 0.1 * elapsed
+        self.drawn = self.drawn + 1
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import argparse
+import threading
+from collections import deque
+from configparser import ConfigParser
+
+import numpy as np
+
+from util.s21_log import open_log
+
+# pace of logs recorded without timestamps, as the old 10 ms replay timer
+DEFAULT_INTERVAL = 0.01
+
+
+def replay_speed(mode):
+    # 'realtime' -> 1, 'fast' -> 0 (no pacing), 'Nx' -> N times speed
+    if mode == 'realtime':
+        return 1.0
+    if mode == 'fast':
+        return 0.0
+    if mode.endswith('x'):
+        return float(mode[:-1])
+    raise ValueError("replay mode must be realtime, fast or Nx, not {!r}".format(mode))
+
+
+# Latency of the stages of a frame, kept for the last window frames, and
+# the number of frames through each stage and through the whole pipeline.
+class StageStats(object):
+
+    def __init__(self, window=10000):
+        self.window = window
+        self._stages = {}
+        self.counts = {}
+        self.frames = 0
+        self._start = None
+
+    def add(self, stage, seconds):
+        samples = self._stages.get(stage)
+        if samples is None:
+            samples = self._stages[stage] = deque(maxlen=self.window)
+        samples.append(seconds)
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def frame(self):
+        # counts one frame through the whole pipeline
+        if self._start is None:
+            self._start = time.perf_counter()
+        self.frames = self.frames + 1
+
+    @property
+    def fps(self):
+        if self._start is None or self.frames < 2:
+            return 0
+        return (self.frames - 1) / (time.perf_counter() - self._start)
+
+    def report(self):
+        lines = ['{} frames, {:.1f} frames/s end to end'.format(self.frames, self.fps)]
+        for stage, samples in self._stages.items():
+            samples = np.array(samples) * 1e3
+            lines.append('  {:<8s}: {} frames, mean {:.3f} ms, p95 {:.3f} ms, max {:.3f} ms'.format(
+                stage, self.counts[stage], samples.mean(), np.percentile(samples, 95),
+                samples.max()))
+        return '\n'.join(lines)
+
+
+# Reads the frames of an S21 log or capture (util.s21_log.open_log) paced
+# like they were recorded. speed scales the recorded inter-frame times
+# (1: real time, N: N times faster); speed 0 returns every frame as soon as
+# it is read. Logs without timestamps are paced at DEFAULT_INTERVAL. A frame
+# that is already due is returned at once and counted as late.
+class LogReplayer(object):
+
+    def __init__(self, path, speed=1.0, start=0, loop=True):
+        self.log = open_log(path)
+        self.freq = self.log.freq
+        self.frames = self.log.frames
+        if self.frames == 0:
+            # e.g. a recording stopped before its first chunk was written
+            self.log.close()
+            raise ValueError("log has no frames: {}".format(path))
+        self.speed = speed
+        self.loop = loop
+        self.late = 0
+        # time (s) the last read() waited for its frame to be due
+        self.waited = 0.0
+        self._index = 0
+        self._anchor = None
+        self._seek = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self.seek(start)
+
+    def seek(self, frame):
+        # the next read() returns frame; safe to call from another thread
+        with self._lock:
+            self._seek = frame % self.frames
+
+    def close(self):
+        # wakes a read() waiting for its frame
+        self._closed.set()
+
+    def frame_time(self, index):
+        # recorded time (s) of frame index
+        t = self.log.time(index)
+        return index * DEFAULT_INTERVAL if t is None else t
+
+    def _wait(self, index):
+        # waits until frame index is due; the first frame sets the pace
+        now = time.perf_counter()
+        if self._anchor is None:
+            self._anchor = (now, self.frame_time(index))
+            return
+        due = self._anchor[0] + (self.frame_time(index) - self._anchor[1]) / self.speed
+        if due > now:
+            self._closed.wait(due - now)
+            self.waited = time.perf_counter() - now
+        else:
+            self.late = self.late + 1
+
+    def read(self):
+        # (index, freq, dB) of the next frame, None at the end of the log
+        # when not looping or once closed
+        with self._lock:
+            if self._seek is not None:
+                self._index, self._seek, self._anchor = self._seek, None, None
+        if self._index >= self.frames:
+            if not self.loop:
+                return None
+            self._index, self._anchor = 0, None
+
+        index = self._index
+        self.waited = 0.0
+        if self.speed > 0:
+            self._wait(index)
+        if self._closed.is_set():
+            return None
+        self._index = index + 1
+        return index, self.freq, np.array(self.log.row(index), dtype=np.float64)
+
+
+def run_headless(path, inifile='setting/default.ini', speed=0.0, start=0, frames=None,
+                 thres=0.03):
+    # replays a log through the detector and state classifier without a GUI
+    from util.pipeline import Pipeline, ReplaySource
+
+    parser = ConfigParser()
+    parser.read(inifile)
+    replayer = LogReplayer(path, speed=speed, start=start, loop=False)
+    pipeline = Pipeline.from_parser(parser, ReplaySource(replayer), thres=thres)
+    return pipeline.run(frames=frames), replayer
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="replay an S21 log through the detection pipeline without a GUI")
+    parser.add_argument("logpath", help="S21 log (.npy) or capture (.npz)")
+    parser.add_argument("-i", "--inipath", default='setting/default.ini')
+    parser.add_argument("-m", "--mode", default='fast',
+                        help="realtime, fast or Nx (N times real time)")
+    parser.add_argument("-s", "--start-frame", type=int, default=0)
+    parser.add_argument("-n", "--frames", type=int, help="stop after this many frames")
+    parser.add_argument("-t", "--thres", type=float, default=0.03)
+    args = parser.parse_args(argv[1:])
+
+    stats, replayer = run_headless(args.logpath, args.inipath, replay_speed(args.mode),
+                                   args.start_frame, args.frames, args.thres)
+    print('replay of {} ({} mode, {} late frames)'.format(
+        args.logpath, args.mode, replayer.late))
+    print(stats.report())
+
+
+if __name__ == '__main__':
+    main(sys.argv)
+    sys.exit()
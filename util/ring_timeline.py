@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import numpy as np
+import pyqtgraph as pg
+
+
+# Scrolling-cursor timeline of one value per frame on a pyqtgraph plot.
+# Samples are written into a ring of depth points on a fixed x axis
+# (0 .. depth); the curve is split into chunk-sized items, so a push only
+# re-uploads the chunk it lands in instead of the whole ring. A marker shows
+# the newest sample.
+class RingTimeline(object):
+
+    def __init__(self, plot, depth=1000, pen=None, brush=None, size=20, chunk=100):
+        # plot: PlotWidget or PlotItem the timeline is drawn on
+        self.plot = plot
+        self.depth = int(depth)
+        self.chunk = max(1, min(int(chunk), self.depth))
+        self.x = np.arange(self.depth, dtype=np.float64)
+        self.y = np.zeros(self.depth)
+        self.count = 0
+        self._filled = 0
+        self._dirty = set()
+
+        self.curves = []
+        for _ in range(0, self.depth, self.chunk):
+            curve = plot.plot([], [], pen=pen)
+            # both only take effect once the ring is larger than the view
+            curve.setClipToView(True)
+            curve.setDownsampling(auto=True, method='peak')
+            self.curves.append(curve)
+        # one spot at the origin, moved onto the newest sample
+        self.marker = pg.ScatterPlotItem([0], [0], size=size, brush=brush)
+        self.marker.setVisible(False)
+        plot.addItem(self.marker)
+        plot.setXRange(0, self.depth, padding=0.05)
+
+    @classmethod
+    def from_parser(cls, parser, plot, pen=None, brush=None, size=20):
+        return cls(plot, depth=parser.getint('viewer', 'timeline_depth', fallback=1000),
+                   pen=pen, brush=brush, size=size)
+
+    def clear(self):
+        self.y[:] = 0
+        self.count = 0
+        self._filled = 0
+        self._dirty.clear()
+        for curve in self.curves:
+            curve.setData([], [])
+        self.marker.setVisible(False)
+
+    def _draw(self, k):
+        # chunk k overlaps the first point of chunk k + 1 so the curve is joined
+        lo = k * self.chunk
+        hi = min(lo + self.chunk + 1, self._filled)
+        self.curves[k].setData(self.x[lo:hi], self.y[lo:hi], skipFiniteCheck=True)
+
+    def push(self, value, render=True):
+        i = self.count % self.depth
+        self.y[i] = value
+        self.count = self.count + 1
+        self._filled = max(self._filled, i + 1)
+
+        k = i // self.chunk
+        self._dirty.add(k)
+        if i % self.chunk == 0 and k > 0:
+            self._dirty.add(k - 1)
+        if render:
+            self.flush()
+
+    def flush(self):
+        if not self.count:
+            return
+        for k in self._dirty:
+            self._draw(k)
+        self._dirty.clear()
+        i = (self.count - 1) % self.depth
+        self.marker.setPos(self.x[i], self.y[i])
+        self.marker.setVisible(True)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import queue
+import threading
+
+import numpy as np
+
+from util.capture import FRAME_DTYPE, CaptureWriter, CaptureReader
+
+# every header is padded to this size, so the row count can be rewritten
+# in place as the file grows
+NPY_HEADER_SIZE = 128
+
+
+def _npy_header(dtype, shape):
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+        np.lib.format.dtype_to_descr(dtype), shape)
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + np.uint16(len(header)).tobytes() + header.encode('latin1')
+
+
+# .npy file that grows by whole rows. The header always holds the number of
+# rows written so far, so the file can be opened with np.load at any time,
+# also while it is still being written or after a crash.
+class NpyAppender(object):
+
+    def __init__(self, path, row_shape=(), dtype=np.float64):
+        self.path = path
+        self.row_shape = tuple(row_shape)
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self._file = open(path, 'wb')
+        self._writeHeader()
+
+    def _writeHeader(self):
+        self._file.seek(0)
+        self._file.write(_npy_header(self.dtype, (self.rows,) + self.row_shape))
+        self._file.seek(0, os.SEEK_END)
+
+    def append(self, rows):
+        # rows: (n,) + row_shape
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        self._file.write(rows.tobytes())
+        self.rows = self.rows + len(rows)
+        self._writeHeader()
+
+    def close(self):
+        if not self._file.closed:
+            self._writeHeader()
+            self._file.close()
+
+
+def timestamp_path(path):
+    # sidecar holding the timestamp of every recorded frame
+    root, ext = os.path.splitext(path)
+    return root + '_time' + ext
+
+
+def load_log(path):
+    # S21 log as a read-only memory map, so opening it costs the same for any
+    # size and only the rows that are read are paged in. Logs np.save wrote
+    # from rows of different lengths hold Python objects and are loaded whole.
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        return np.load(path, allow_pickle=True)
+
+
+def load_timestamps(path):
+    # frame times of a recorded log, None for logs recorded without them
+    path = timestamp_path(path)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode='r')
+
+
+# .npy log (row 0: frequency axis) behind the interface of CaptureReader.
+class S21Log(object):
+
+    def __init__(self, path):
+        self.path = path
+        self._log = load_log(path)
+        self._times = load_timestamps(path)
+        self.freq = np.array(self._log[0], dtype=np.float64)
+        self.attrs = {}
+        self.frames = len(self._log) - 1
+        if self._times is not None:
+            # frames recorded after the last timestamp flush have no time
+            self.frames = min(self.frames, len(self._times))
+
+    def row(self, index):
+        # row 0 is the freq axis
+        return self._log[index + 1]
+
+    def time(self, index):
+        # None for logs recorded without timestamps
+        return None if self._times is None else self._times[index]
+
+    def close(self):
+        pass
+
+
+def open_log(path):
+    # capture (.npz) or .npy log, both read lazily
+    if os.path.splitext(path)[1] == '.npz':
+        return CaptureReader(path)
+    return S21Log(path)
+
+
+# Writes the layout np.save gave the old recordings: row 0 is the frequency
+# axis (MHz), every following row the dB of one frame; the time of every
+# frame goes to a sidecar (timestamp_path).
+class _NpyLogWriter(object):
+
+    def __init__(self, path, freq):
+        self._log = NpyAppender(path, row_shape=freq.shape)
+        self._log.append(freq[None])
+        self._time = NpyAppender(timestamp_path(path))
+
+    def write(self, rows, table):
+        self._log.append(rows)
+        self._time.append(table['time'])
+
+    def close(self):
+        self._log.close()
+        self._time.close()
+
+
+# Streams S21 frames into a log on a background thread: a capture
+# (util.capture, with attrs, the per-frame table and optionally delta encoded
+# frames) when path ends in .npz, a .npy log otherwise. Frames are written in
+# chunks of chunk rows, and at most queue_size frames wait for the disk: when
+# it falls behind, further frames are dropped and counted. Frames on another frequency axis (roi
+# sweeps) do not fit the log and are counted as skipped.
+class S21Recorder(threading.Thread):
+
+    def __init__(self, path, freq, attrs=None, chunk=64, queue_size=1024, interval=0.1,
+                 encoding='raw', resolution=0.001):
+        super().__init__(daemon=True)
+        self.path = path
+        self.freq = np.array(freq, dtype=np.float64)
+        self.chunk = chunk
+        self.interval = interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closing = threading.Event()
+        if os.path.splitext(path)[1] == '.npz':
+            self._writer = CaptureWriter(path, self.freq, attrs, encoding, resolution)
+        else:
+            self._writer = _NpyLogWriter(path, self.freq)
+        self.frames = 0
+        self.dropped = 0
+        self.skipped = 0
+
+    def put(self, freq, dB, t, thres=np.nan, peak_freq=np.nan, peaks=0):
+        # called from the GUI thread; never blocks
+        if self._closing.is_set():
+            # too late for the final drain
+            self.dropped = self.dropped + 1
+            return
+        if not np.array_equal(freq, self.freq):
+            self.skipped = self.skipped + 1
+            return
+        try:
+            self._queue.put_nowait((np.array(dB, dtype=np.float64),
+                                    (t, thres, peak_freq, peaks)))
+        except queue.Full:
+            self.dropped = self.dropped + 1
+
+    def _drain(self):
+        # everything queued so far
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def run(self):
+        # wakes every interval s rather than per frame, so the GUI thread
+        # is not interrupted for every frame it puts
+        rows = np.empty((self.chunk, len(self.freq)))
+        table = np.empty(self.chunk, dtype=FRAME_DTYPE)
+        n = 0
+        closing = False
+        while not closing:
+            # the queue is drained once more after close() set the event
+            closing = self._closing.wait(self.interval)
+            for dB, meta in self._drain():
+                rows[n], table[n] = dB, meta
+                n = n + 1
+                if n == self.chunk:
+                    self._write(rows, table, n)
+                    n = 0
+        if n:
+            self._write(rows, table, n)
+        self._writer.close()
+
+    def _write(self, rows, table, n):
+        self._writer.write(rows[:n], table[:n])
+        self.frames = self.frames + n
+
+    def close(self, timeout=None):
+        # writes what is queued, then finishes the files; waits at most
+        # timeout s for that and returns whether the files are finished.
+        # Never blocks on a full queue, so the GUI thread may call it.
+        self._closing.set()
+        if self.is_alive():
+            self.join(timeout)
+            return not self.is_alive()
+        self.run()
+        return True
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import numpy as np
+
+
+# one row per (peak, sensor) pair whose nearest state is within range/2;
+# distance (MHz) is |peak - state frequency|
+PEAK_STATE_DTYPE = np.dtype([('peak_id', np.int16), ('peak', np.float64),
+                             ('sensor', np.int16), ('state', np.int16),
+                             ('distance', np.float64)])
+
+
+# Resolves peak frequencies to the state of every sensor at once.
+# The state of a sensor is its listed peak frequency nearest to the peak
+# (first listed on ties), or 'none' when that is not within range/2.
+# The frequency axis is precompiled into the points where any state can
+# change (midpoints between neighbouring frequencies and range bounds) and
+# the intervals between them, each labelled with the state and the nearest
+# frequency of every sensor. Classifying any number of peaks is then one
+# np.searchsorted and a table gather.
+class StateClassifier(object):
+
+    def __init__(self, tables):
+        # tables: {sensor: (state_list, peak_list, peak_range)}
+        self.sensors = list(tables)
+        self.state_lists = [list(tables[sensor][0]) for sensor in self.sensors]
+        self.ranges = np.array([tables[sensor][2] for sensor in self.sensors],
+                               dtype=np.float64)
+
+        centres, first_ids = [], []
+        for sensor in self.sensors:
+            # first occurrence of each frequency, as an argmin over the list finds it
+            centre, first_id = np.unique(np.asarray(tables[sensor][1], dtype=np.float64),
+                                         return_index=True)
+            centres.append(centre)
+            first_ids.append(first_id)
+
+        bounds = [np.concatenate([(centre[:-1] + centre[1:]) / 2,
+                                  centre - peak_range / 2, centre + peak_range / 2])
+                  for centre, peak_range in zip(centres, self.ranges)]
+        self._bounds = np.unique(np.concatenate(bounds))
+
+        # every interval (even rows) and bound (odd rows) from left to right
+        points = np.empty(2 * len(self._bounds) + 1)
+        points[1::2] = self._bounds
+        points[2:-1:2] = (self._bounds[:-1] + self._bounds[1:]) / 2
+        points[0], points[-1] = self._bounds[0] - 1, self._bounds[-1] + 1
+
+        state_ids = np.empty((len(points), len(self.sensors)), dtype=np.int16)
+        nearest = np.empty((len(points), len(self.sensors)))
+        for k, (centre, first_id) in enumerate(zip(centres, first_ids)):
+            state_ids[:, k], nearest[:, k] = self._nearest(
+                points, centre, first_id, self.ranges[k])
+        self._state_ids = state_ids
+        self._nearest_freq = nearest
+        self._states = [self._names(ids) for ids in state_ids]
+
+    @staticmethod
+    def _nearest(peaks, centre, first_id, peak_range):
+        # state id (-1 for 'none') and nearest frequency of one sensor
+        right = np.minimum(np.searchsorted(centre, peaks), len(centre) - 1)
+        left = np.maximum(right - 1, 0)
+        d_left = np.abs(centre[left] - peaks)
+        d_right = np.abs(centre[right] - peaks)
+        pick_right = (d_right < d_left) | (
+            (d_right == d_left) & (first_id[right] < first_id[left]))
+        nearest = np.where(pick_right, right, left)
+        distance = np.where(pick_right, d_right, d_left)
+        return np.where(distance < peak_range / 2, first_id[nearest], -1), centre[nearest]
+
+    @classmethod
+    def from_parser(cls, parser, sensors):
+        # sensor sections of an ini: state = peak freq (MHz), range = freq (MHz)
+        tables = {}
+        for sensor in sensors:
+            state_list, peak_list, peak_range = [], [], None
+            for key in parser[sensor]:
+                if key == 'range':
+                    peak_range = float(parser[sensor][key])
+                    continue
+                state_list.append(key)
+                peak_list.append(float(parser[sensor][key]))
+            tables[sensor] = (state_list, peak_list, peak_range)
+        return cls(tables)
+
+    def _rows(self, peaks):
+        # table row of every peak
+        i = np.searchsorted(self._bounds, peaks)
+        on_bound = self._bounds[np.minimum(i, len(self._bounds) - 1)] == peaks
+        return 2 * i + on_bound
+
+    def _names(self, ids):
+        return {sensor: states[i] if i >= 0 else 'none'
+                for sensor, states, i in zip(self.sensors, self.state_lists, ids)}
+
+    def classify(self, peaks):
+        # index into state_lists[k] for every peak (rows) and sensor k
+        # (columns); -1 for 'none'
+        return self._state_ids[self._rows(np.asarray(peaks, dtype=np.float64).reshape(-1))]
+
+    def classify_peaks(self, peaks):
+        # every (peak, sensor) match of a multi-peak sweep as PEAK_STATE_DTYPE
+        peaks = np.asarray(peaks, dtype=np.float64).reshape(-1)
+        rows = self._rows(peaks)
+        peak_ids, sensors = np.nonzero(self._state_ids[rows] >= 0)
+
+        matches = np.empty(len(peak_ids), dtype=PEAK_STATE_DTYPE)
+        matches['peak_id'] = peak_ids
+        matches['peak'] = peaks[peak_ids]
+        matches['sensor'] = sensors
+        matches['state'] = self._state_ids[rows[peak_ids], sensors]
+        matches['distance'] = np.abs(self._nearest_freq[rows[peak_ids], sensors]
+                                     - matches['peak'])
+        return matches
+
+    def states(self, peak):
+        # {sensor: state} of a single peak
+        return dict(self._states[self._rows(peak)])
+
+    def sensor_states(self, peaks):
+        # {sensor: state} of a multi-peak sweep; each sensor takes its
+        # closest match, so several rings are read from one sweep; every
+        # sensor is 'none' without peaks
+        if len(peaks) == 0:
+            return self._names(np.full(len(self.sensors), -1))
+        if len(peaks) == 1:
+            return self.states(peaks[0])
+        peaks = np.asarray(peaks, dtype=np.float64)
+        rows = self._rows(peaks)
+        state_ids = self._state_ids[rows]
+        distance = np.abs(self._nearest_freq[rows] - peaks[:, None])
+        distance[state_ids < 0] = np.inf
+        best = state_ids[np.argmin(distance, axis=0), np.arange(len(self.sensors))]
+        return self._names(best)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+from collections import namedtuple
+
+
+# kind: 'transition' (debounced state change), 'press' (a non-idle state is
+# entered), 'release' (it is left), 'hold' (repeated while it is held) or
+# 'long_press' (once, after it was held for long_press s).
+# time is when the event happened; duration is how long the pressed (or, for
+# a transition, the previous) state was held.
+StateEvent = namedtuple('StateEvent', 'sensor kind state previous time duration')
+
+
+class _SensorTrack(object):
+
+    def __init__(self):
+        self.state = None
+        self.since = None
+        self.candidate = None
+        self.candidate_since = None
+        self.last_hold = None
+        self.long_sent = False
+
+
+# Turns per-frame sensor states into debounced, timestamped events.
+# A state is accepted once it has been seen for debounce s without
+# interruption, so single-frame flickers between states produce no events.
+# update() is fed the {sensor: state} of every frame, or only when it
+# changed; tick() accepts debounced states and emits hold and long_press
+# events while no updates arrive.
+class StateEventEngine(object):
+
+    def __init__(self, debounce=0.03, long_press=1.0, hold_repeat=0.2,
+                 idle_states=('none',)):
+        self.debounce = debounce
+        self.long_press = long_press
+        self.hold_repeat = hold_repeat
+        self.idle_states = set(idle_states)
+        self._tracks = {}
+        self.frames = 0
+        self.events = 0
+
+    @classmethod
+    def from_parser(cls, parser):
+        return cls(debounce=parser.getfloat('event', 'debounce', fallback=0.03),
+                   long_press=parser.getfloat('event', 'long_press', fallback=1.0),
+                   hold_repeat=parser.getfloat('event', 'hold_repeat', fallback=0.2),
+                   idle_states=[state.strip() for state in parser.get(
+                       'event', 'idle_states', fallback='none').split(',')])
+
+    def reset(self):
+        self._tracks = {}
+
+    def _is_pressed(self, state):
+        return state is not None and state not in self.idle_states
+
+    def update(self, sensor_info, t=None):
+        t = time.monotonic() if t is None else t
+        self.frames = self.frames + 1
+        for sensor, state in sensor_info.items():
+            track = self._tracks.get(sensor)
+            if track is None:
+                track = self._tracks[sensor] = _SensorTrack()
+            if state != track.candidate:
+                track.candidate, track.candidate_since = state, t
+        return self.tick(t)
+
+    def tick(self, t=None):
+        t = time.monotonic() if t is None else t
+        events = []
+        for sensor, track in self._tracks.items():
+            if track.candidate != track.state and t - track.candidate_since >= self.debounce:
+                self._accept(sensor, track, events)
+            self._held(sensor, track, t, events)
+        self.events = self.events + len(events)
+        return events
+
+    def _accept(self, sensor, track, events):
+        previous, state, t = track.state, track.candidate, track.candidate_since
+        held = t - track.since if track.since is not None else 0.0
+        events.append(StateEvent(sensor, 'transition', state, previous, t, held))
+        if self._is_pressed(previous):
+            events.append(StateEvent(sensor, 'release', previous, previous, t, held))
+        if self._is_pressed(state):
+            events.append(StateEvent(sensor, 'press', state, previous, t, 0.0))
+        track.state, track.since, track.last_hold, track.long_sent = state, t, t, False
+
+    def _held(self, sensor, track, t, events):
+        # paused while a change of state is being debounced
+        if not self._is_pressed(track.state) or track.candidate != track.state:
+            return
+        held = t - track.since
+        if self.long_press > 0 and not track.long_sent and held >= self.long_press:
+            track.long_sent = True
+            events.append(StateEvent(sensor, 'long_press', track.state, track.state, t, held))
+        if self.hold_repeat > 0 and t - track.last_hold >= self.hold_repeat:
+            track.last_hold = t
+            events.append(StateEvent(sensor, 'hold', track.state, track.state, t, held))
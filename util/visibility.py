@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+from PyQt5 import sip
+from PyQt5.QtCore import *
+
+
+# Tracks whether a widget can be seen: it is shown (its tab is the current
+# one) and its window is not minimized. visible is a plain attribute, cheap
+# enough to test on every frame; on_show() is called when the widget becomes
+# visible again so it can catch up from the latest frame.
+class VisibilityGate(QObject):
+
+    def __init__(self, widget, on_show=None):
+        super().__init__(widget)
+        self.widget = widget
+        self.on_show = on_show
+        self._window = None
+        self.visible = False
+        widget.installEventFilter(self)
+        self._watchWindow()
+        self._refresh()
+
+    def _watchWindow(self):
+        # the widget may have been moved into another window (e.g. a tab)
+        window = self.widget.window()
+        if window is not self._window:
+            if self._window is not None and not sip.isdeleted(self._window):
+                self._window.removeEventFilter(self)
+            if window is not self.widget:
+                window.installEventFilter(self)
+            self._window = window
+
+    def _refresh(self):
+        if sip.isdeleted(self._window):
+            self.visible = False
+            return
+        visible = self.widget.isVisible() and not self._window.isMinimized()
+        shown, self.visible = visible and not self.visible, visible
+        if shown and self.on_show is not None:
+            self.on_show()
+
+    def eventFilter(self, obj, event):
+        if obj is self.widget and event.type() in (QEvent.Show, QEvent.Hide):
+            self._watchWindow()
+            self._refresh()
+        elif obj is self._window and event.type() == QEvent.WindowStateChange:
+            self._refresh()
+        return False
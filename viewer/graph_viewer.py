@@ -8,18 +8,28 @@ import math
 import datetime
 import numpy as np
 import pandas as pd
+from configparser import ConfigParser
 
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 import pyqtgraph as pg
 
+from util.render_scheduler import RenderScheduler
+from util.ring_timeline import RingTimeline
+from util.axis_range import AxisRange
+from util.visibility import VisibilityGate
+from util.s21_log import S21Recorder
+
 
 class GraphViewer(pg.GraphicsLayoutWidget):
-    def __init__(self, parent):
+    def __init__(self, parent, inifile='setting/default.ini'):
         super().__init__(parent)
         self.winID = parent.winId()
 
+        self.parser = ConfigParser()
+        self.parser.read(inifile)
+
         self.font = QFont('Arial', 15)
 
         self.setStyleSheet(
@@ -30,11 +40,16 @@ class GraphViewer(pg.GraphicsLayoutWidget):
         self.diffGraph = pg.PlotWidget(background=(40, 40, 40))
         self.timelineGraph = pg.PlotWidget(background=(40, 40, 40))
 
+        # shown instead of the graphs when every graph is unchecked
+        self.emptyGraph = pg.PlotWidget()
+        self.emptyGraph.setVisible(False)
+
         self.defaultGraphLayout = QHBoxLayout()
         # self.defaultGraphLayout.setSpacing(50)
-        self.defaultGraphLayout.addWidget(self.rawGraph)
-        self.defaultGraphLayout.addWidget(self.diffGraph)
-        self.defaultGraphLayout.addWidget(self.timelineGraph)
+        self.defaultGraphLayout.addWidget(self.rawGraph, stretch=1)
+        self.defaultGraphLayout.addWidget(self.diffGraph, stretch=1)
+        self.defaultGraphLayout.addWidget(self.timelineGraph, stretch=1)
+        self.defaultGraphLayout.addWidget(self.emptyGraph)
 
         self.startButton = QPushButton("Start", self)
         self.stopButton = QPushButton("Stop", self)
@@ -62,6 +77,8 @@ class GraphViewer(pg.GraphicsLayoutWidget):
         self.rawGraphCheckBox.setChecked(True)
         self.diffGraphCheckBox.setChecked(True)
         self.timelineGraphCheckBox.setChecked(True)
+        # checkbox states, kept by changeGraphLayout
+        self.show_raw = self.show_diff = self.show_timeline = True
         self.rawGraphCheckBox.stateChanged.connect(self.changeGraphLayout)
         self.diffGraphCheckBox.stateChanged.connect(self.changeGraphLayout)
         self.timelineGraphCheckBox.stateChanged.connect(self.changeGraphLayout)
@@ -92,8 +109,8 @@ class GraphViewer(pg.GraphicsLayoutWidget):
         mainLayout.addLayout(self.toolLayout, 1, 0)
         self.setLayout(mainLayout)
 
-        self.S21_log_data = []
-        self.MAX_LOG_CNT = 200
+        # streams the S21 frames to log/ until the plot is stopped
+        self.recorder = None
         self.is_running = False
         self.is_recording = False
 
@@ -102,6 +119,16 @@ class GraphViewer(pg.GraphicsLayoutWidget):
 
         self.initGraph()
 
+        # draw at a capped rate, independent of the VNA frame rate
+        self.render_scheduler = RenderScheduler(
+            self._drawGraph, self.parser.getfloat('viewer', 'render_fps', fallback=60), self)
+
+        # frames are held back while the tab is hidden or the window
+        # minimized; the latest one is drawn as soon as it is shown again
+        self._hidden_frame = None
+        self.hidden_frames = 0
+        self.visibility = VisibilityGate(self, on_show=self._catchUp)
+
     def initGraph(self):
         self.rawGraph.addLegend()
         self.diffGraph.addLegend()
@@ -133,10 +160,8 @@ class GraphViewer(pg.GraphicsLayoutWidget):
         self.diffGraph.addItem(self.peak_scatter_in_diff)
 
         pen = pg.mkPen(green, width=5, style=Qt.SolidLine)
-        self.peak_timeline = self.timelineGraph.plot([], [], pen=pen)
-        self.peak_scatter_in_timeline = pg.ScatterPlotItem(
-            size=20, brush=pg.mkBrush(green))
-        self.timelineGraph.addItem(self.peak_scatter_in_timeline)
+        self.peak_timeline = RingTimeline.from_parser(
+            self.parser, self.timelineGraph, pen=pen, brush=pg.mkBrush(green))
 
         self.rawGraph.setTitle('Output of readout board')
         self.rawGraph.setLabel("left", "S21 (dB)")
@@ -150,22 +175,52 @@ class GraphViewer(pg.GraphicsLayoutWidget):
         self.timelineGraph.setLabel("left", "Peak (MHz)")
         self.timelineGraph.setLabel("bottom", "Count")
 
-        self.cnt = 0
-        self.MAX_CNT = 50
-        self.timeline_x = np.arange(0, self.MAX_CNT, 1)
-        self.timeline_y = np.zeros(self.MAX_CNT)
-        self.peak_timeline.setData(self.timeline_x, self.timeline_y)
-        self.timelineGraph.setXRange(0, self.MAX_CNT, padding=0.05)
         self.rawGraph.showGrid(x=True, y=True)
         self.diffGraph.showGrid(x=True, y=True)
         self.timelineGraph.showGrid(x=True, y=True)
 
+        # view ranges are only moved when the data leaves them
+        hysteresis = self.parser.getfloat('viewer', 'range_hysteresis', fallback=0.5)
+        self.raw_x_range = AxisRange(self.rawGraph.setXRange, hysteresis=0)
+        self.raw_y_range = AxisRange(self.rawGraph.setYRange, step=2, margin=1,
+                                     hysteresis=hysteresis, padding=0.01)
+        self.diff_x_range = AxisRange(self.diffGraph.setXRange, hysteresis=0)
+        self.diff_y_range = AxisRange(self.diffGraph.setYRange, step=0.2,
+                                      hysteresis=hysteresis, padding=0.01)
+        # samples already in the timeline keep their place, so it only grows
+        self.timeline_y_range = AxisRange(self.timelineGraph.setYRange, hysteresis=1)
+        self.axis_ranges = [self.raw_x_range, self.raw_y_range, self.diff_x_range,
+                            self.diff_y_range, self.timeline_y_range]
+
         self.is_running = True
 
     def updateGraph(self, s21_data):
         if not self.is_running:
             return
 
+        if self.is_recording and self.recorder is None and s21_data[12]:
+            # the log takes the axis of a full-span sweep; roi sweeps around
+            # the peak are skipped
+            self._startRecorder(s21_data[0])
+        if self.recorder is not None:
+            self.recorder.put(s21_data[0], s21_data[1], s21_data[9], thres=s21_data[8],
+                              peak_freq=s21_data[10], peaks=len(s21_data[5]))
+
+        if not self.visibility.visible:
+            self._hidden_frame = s21_data
+            self.hidden_frames = self.hidden_frames + 1
+            return
+        self.render_scheduler.submit(s21_data)
+
+    def _catchUp(self):
+        frame, self._hidden_frame = self._hidden_frame, None
+        if frame is not None:
+            self.render_scheduler.submit(frame)
+
+    def _drawGraph(self, s21_data):
+        if not self.is_running:
+            return
+
         self.statusbar.showMessage('graph viewer on')
         # Get signal from util/qt_vna.py
         self.freq = s21_data[0]
@@ -177,22 +232,14 @@ class GraphViewer(pg.GraphicsLayoutWidget):
         self.vna_fps = s21_data[6]
         self.target_ids = s21_data[7]
         self.thres = s21_data[8]
+        self.peak_freq = s21_data[10]
 
         self.target_freq = self.freq[self.target_ids]
 
-        if self.is_recording:
-            if len(self.S21_log_data) < self.MAX_LOG_CNT:
-                self.S21_log_data.append(self.raw_dB)
-            else:
-                self._saveS21LogtoFile()
-
-        st = time.time()
 
-        if self.rawGraphCheckBox.isChecked():
-            base_max = 2 * math.ceil(np.max(self.raw_dB)/2)
-            base_min = 2 * math.floor(np.min(self.raw_dB)/2)
-            self.rawGraph.setXRange(self.freq[0], self.freq[-1], padding=0.05)
-            self.rawGraph.setYRange(base_min - 1, base_max + 1, padding=0.01)
+        if self.show_raw:
+            self.raw_x_range.update(self.freq[0], self.freq[-1])
+            self.raw_y_range.update(self.raw_dB.min(), self.raw_dB.max())
             self.raw_line.setData(self.freq, self.raw_dB)
             self.base_line.setData(self.target_freq, self.base_dB)
             if len(self.peaks) > 0:
@@ -202,12 +249,10 @@ class GraphViewer(pg.GraphicsLayoutWidget):
             else:
                 self.peak_scatter.setData([], [])
 
-        if self.diffGraphCheckBox.isChecked():
-            diff_max = max(np.max(self.diff_w_filter_dB), np.max(self.diff_dB))
-            diff_max = 0.2 * math.ceil(diff_max/0.2)
-            self.diffGraph.setXRange(
-                self.target_freq[0], self.target_freq[-1], padding=0.05)
-            self.diffGraph.setYRange(0, diff_max, padding=0.01)
+        if self.show_diff:
+            diff_max = max(self.diff_w_filter_dB.max(), self.diff_dB.max())
+            self.diff_x_range.update(self.target_freq[0], self.target_freq[-1])
+            self.diff_y_range.update(0, diff_max)
             self.diff_line.setData(self.target_freq, self.diff_dB)
             self.diff_w_filter_line.setData(
                 self.target_freq, self.diff_w_filter_dB)
@@ -217,68 +262,82 @@ class GraphViewer(pg.GraphicsLayoutWidget):
             else:
                 self.peak_scatter_in_diff.setData([], [])
 
-        if self.timelineGraphCheckBox.isChecked():
-            self.timelineGraph.setYRange(
-                self.target_freq[0], self.target_freq[-1], padding=0.05)
-            self.timeline_y[self.cnt %
-                            self.MAX_CNT] = self.target_freq[self.peaks] if len(self.peaks) else self.freq[0]
-            self.peak_timeline.setData(self.timeline_x, self.timeline_y)
-            self.peak_scatter_in_timeline.setData([self.timeline_x[self.cnt %
-                                                                   self.MAX_CNT]], [self.timeline_y[self.cnt %
-                                                                                                    self.MAX_CNT]])
-            self.cnt = self.cnt + 1 if self.cnt < 100000 else 0
-
-        elapsed = time.time()-st
-        self.draw_fps = 1/(elapsed) if (elapsed > 0) else 1000
-
-        self.statusText.setText(
-            'VNA FPS: {:.0f}, Draw FPS: {:.0f}'.format(self.vna_fps, self.draw_fps))
+        if self.show_timeline:
+            self.timeline_y_range.update(self.target_freq[0], self.target_freq[-1])
+            self.peak_timeline.push(
+                self.peak_freq if len(self.peaks) else self.freq[0])
+
+        self.draw_fps = self.render_scheduler.draw_fps
+
+        status = 'VNA FPS: {:.0f}, Draw FPS: {:.0f} ({:.1f} ms), Coalesced frames: {}, ' \
+            'Range updates: {}/{}'.format(
+                self.vna_fps, self.draw_fps, self.render_scheduler.draw_time * 1e3,
+                self.render_scheduler.coalesced,
+                sum(axis.updates for axis in self.axis_ranges),
+                sum(axis.updates + axis.skipped for axis in self.axis_ranges))
+        if self.recorder is not None:
+            status = status + ', Recorded: {} ({} dropped)'.format(
+                self.recorder.frames, self.recorder.dropped)
+        self.statusText.setText(status)
         if len(self.peaks) > 0:
             peak_msg = ["({} MHz, {:.3f} dB), ".format(
                 self.target_freq[id], self.diff_dB[id]) for id in self.peaks]
             self.peaklogText.setText("(Peak): " + " ".join(peak_msg))
 
     def changeGraphLayout(self):
-        self.is_running = False
-        for i in reversed(range(self.defaultGraphLayout.count())):
-            self.defaultGraphLayout.itemAt(i).widget().setParent(None)
-
-        cnt = 0
-        if self.rawGraphCheckBox.isChecked():
-            self.defaultGraphLayout.addWidget(self.rawGraph, stretch=1)
-            cnt = cnt + 1
-
-        if self.diffGraphCheckBox.isChecked():
-            self.defaultGraphLayout.addWidget(
-                self.diffGraph, stretch=1)
-            cnt = cnt + 1
-
-        if self.timelineGraphCheckBox.isChecked():
-            self.defaultGraphLayout.addWidget(
-                self.timelineGraph, stretch=1)
-            cnt = cnt + 1
-
-        if cnt == 0:
-            emptyGraph = pg.PlotWidget()
-            self.defaultGraphLayout.addWidget(emptyGraph)
-
-        self.is_running = True
+        # hidden graphs keep their place in the layout and their view ranges
+        self.show_raw = self.rawGraphCheckBox.isChecked()
+        self.show_diff = self.diffGraphCheckBox.isChecked()
+        self.show_timeline = self.timelineGraphCheckBox.isChecked()
+        self.rawGraph.setVisible(self.show_raw)
+        self.diffGraph.setVisible(self.show_diff)
+        self.timelineGraph.setVisible(self.show_timeline)
+        self.emptyGraph.setVisible(not (self.show_raw or self.show_diff or self.show_timeline))
 
     def startPlot(self):
         self.is_running = True
         self.startButton.setEnabled(False)
         self.stopButton.setEnabled(True)
 
+    def _startRecorder(self, freq):
+        # npz: capture with the [VNA] settings and a per-frame table, npy: bare log
+        now = datetime.datetime.now()
+        filename = 'log/s21_type1_on_{}{}{}{}.{}'.format(
+            now.month, now.day, now.hour, now.minute,
+            self.parser.get('viewer', 'record_format', fallback='npz'))
+        attrs = dict(self.parser['VNA']) if self.parser.has_section('VNA') else {}
+        attrs['recorded'] = now.isoformat()
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            self.recorder = S21Recorder(
+                filename, freq, attrs=attrs,
+                encoding=self.parser.get('viewer', 'record_encoding', fallback='raw'),
+                resolution=self.parser.getfloat('viewer', 'record_resolution', fallback=0.001))
+        except (OSError, ValueError) as e:
+            # reported once; recording stops instead of failing every frame
+            msg = 'Recording failed: {}'.format(e)
+            self.statusText.setText(msg)
+            print(msg)
+            self.is_recording = False
+            self.recordButton.setEnabled(True)
+            return
+        self.recorder.start()
+
     def _saveS21LogtoFile(self):
         if not self.is_recording:
             return
 
-        now = datetime.datetime.now()
-        filename = 'log/s21_type1_on_{}{}{}{}'.format(
-            now.month, now.day, now.hour, now.minute)
-        np.save(filename, self.S21_log_data)
-        self.S21_log_data = []
         self.is_recording = False
+        if self.recorder is not None:
+            finished = self.recorder.close(timeout=2.0)
+            msg = 'Recorded {} frames to {} ({} dropped, {} on another axis skipped)'.format(
+                self.recorder.frames, self.recorder.path, self.recorder.dropped,
+                self.recorder.skipped)
+            if not finished:
+                msg += ', still writing in the background'
+            self.statusText.setText(msg)
+            print(msg)
+            self.recorder = None
         self.recordButton.setEnabled(True)
 
     def stopPlot(self):
@@ -328,6 +387,6 @@ class GraphViewer(pg.GraphicsLayoutWidget):
         self.saveButton.setEnabled(True)
 
     def recordS21Data(self):
+        # the log starts with the frequency axis of the next frame
         self.is_recording = True
         self.recordButton.setEnabled(False)
-        self.S21_log_data.append(self.freq)
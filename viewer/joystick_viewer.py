@@ -112,12 +112,18 @@ class JoystickViewer(QWidget):
         self.stopButton.setEnabled(False)
         self.startButton.setEnabled(True)
 
-    def updateJoystickState(self, sensor_info):
-        self.joystick_state = sensor_info['joystick']
-        self.statusbar.showMessage(
-            'joystick state: {}'.format(self.joystick_state))
-        self.game_board[self.current_game].updateState(self.joystick_state)
-        self.update()
+    def onStateEvent(self, event):
+        if event.sensor != 'joystick':
+            return
+
+        if event.kind == 'transition':
+            self.joystick_state = event.state
+            self.statusbar.showMessage(
+                'joystick state: {}'.format(self.joystick_state))
+            self.update()
+        elif event.kind in ('press', 'hold'):
+            # one move on press and one more every hold_repeat while held
+            self.game_board[self.current_game].updateState(event.state)
 
     @ pyqtSlot(QKeyEvent)
     def onKeyPressEvent(self, event: QKeyEvent):
@@ -60,11 +60,11 @@ class ScrollViewer(QWidget):
 
         self.setLayout(self.mainLayout)
 
-    def updatePaperPos(self, sensor_info):
-        if self.is_paused:
+    def onStateEvent(self, event):
+        if self.is_paused or event.sensor != 'scroll' or event.kind != 'transition':
             return
 
-        scroll_state = sensor_info['scroll']
+        scroll_state = event.state
         self.statusbar.showMessage('scroll state: {}'.format(scroll_state))
 
         if scroll_state == 'press' or scroll_state == 'none':
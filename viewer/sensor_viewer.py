@@ -14,6 +14,10 @@ from PyQt5.QtWidgets import *
 import pyqtgraph as pg
 
 from util.helper_func import *
+from util.state_classifier import StateClassifier
+from util.ring_timeline import RingTimeline
+from util.axis_range import AxisRange
+from util.visibility import VisibilityGate
 
 
 SENSOR_LIST = ['switch', 'slider', 'joystick', 'scroll', 'mouse']
@@ -42,6 +46,7 @@ class SensorViewer(QWidget):
         self.PEAK_TABLE = {}
         for key in SENSOR_LIST:
             self.PEAK_TABLE[key] = self._createPeakInfoTable(key)
+        self._buildClassifier()
 
         self.font = QFont('Arial', 12)
         self.sensorFont = QFont('Arial', 20)
@@ -58,8 +63,17 @@ class SensorViewer(QWidget):
             self.status_pic_dict[key].setScaledContents(True)
             self.status_pic_dict[key].setPixmap(
                 self.PEAK_TABLE[key].img('none'))
-            self.status_pic_dict[key].setScaledContents(True)
             self.qt_table_dict[key] = self._createQtTable(self.PEAK_TABLE[key])
+            self.qt_table_dict[key].itemChanged.connect(
+                lambda item, key=key: self.updatePeakTable(key, item))
+
+        # state each sensor's picture and label show, and the sensor_info last
+        # emitted; both are only touched when a state changes, and suppressed
+        # counts the redundant updates that were skipped
+        self.shown_states = {key: 'none' for key in SENSOR_LIST}
+        self.sensor_info = None
+        self.states = None
+        self.suppressed = 0
 
         self.current_sensor = SENSOR_LIST[0]
         self.sensorLayout = QVBoxLayout()
@@ -124,12 +138,8 @@ class SensorViewer(QWidget):
             30, 30, 30)) if dark_mode else pg.PlotWidget(background=(250, 250, 255))
         self.timelineGraph.addLegend()
         pen = pg.mkPen(green, width=5, style=Qt.SolidLine)
-        self.peak_timeline = self.timelineGraph.plot(
-            [], [], pen=pen, viewbox=None)
-
-        self.peak_scatter_in_timeline = pg.ScatterPlotItem(
-            size=20, brush=pg.mkBrush(green))
-        self.timelineGraph.addItem(self.peak_scatter_in_timeline)
+        self.peak_timeline = RingTimeline.from_parser(
+            self.parser, self.timelineGraph, pen=pen, brush=pg.mkBrush(green))
         self.timelineGraph.setLabel("left", "Peak (MHz)")
         self.timelineGraph.setLabel("bottom", "Count")
         self.peakLabel = pg.LabelItem(
@@ -138,13 +148,9 @@ class SensorViewer(QWidget):
         self.peakLabel.setParentItem(self.inst)
         self.peakLabel.anchor(itemPos=(1, 0), parentPos=(1, 0), offset=(0, 0))
 
-        self.cnt = 0
-        self.MAX_CNT = 200
-        self.timeline_x = np.arange(0, self.MAX_CNT, 1)
-        self.timeline_y = np.zeros(self.MAX_CNT)
-        self.peak_timeline.setData(self.timeline_x, self.timeline_y)
-        self.timelineGraph.setXRange(0, self.MAX_CNT, padding=0.05)
         self.timelineGraph.showGrid(x=True, y=True)
+        # samples already in the timeline keep their place, so it only grows
+        self.timeline_y_range = AxisRange(self.timelineGraph.setYRange, hysteresis=1)
 
         self.sensorinfoLayout = QVBoxLayout()
         self.sensorinfoLayout.addLayout(self.sensorLayout, stretch=4)
@@ -162,6 +168,10 @@ class SensorViewer(QWidget):
         self.statusbar = parent.statusBar()
         self.statusbar.setFont(self.font)
 
+        # nothing is drawn while the tab is hidden or the window minimized;
+        # states are still emitted and the timeline still records
+        self.visibility = VisibilityGate(self, on_show=self._catchUp)
+
     def _createPeakInfoTable(self, section, dark_mode=False):
         key_list, peak_list = [], []
         img_dict = {}
@@ -200,11 +210,31 @@ class SensorViewer(QWidget):
         qtable.resizeColumnsToContents()
         return qtable
 
+    def _buildClassifier(self):
+        self.classifier = StateClassifier(
+            {key: (itable.state_list, itable.peak_list, itable.peak_range)
+             for key, itable in self.PEAK_TABLE.items()})
+
+    def updatePeakTable(self, sensor, item):
+        # the lookup table is only rebuilt when a cell is edited
+        try:
+            value = float(item.text())
+        except ValueError:
+            return
+        itable = self.PEAK_TABLE[sensor]
+        if item.column() == len(itable.state_list):
+            itable.peak_range = value
+        else:
+            itable.peak_list[item.column()] = value
+        self._buildClassifier()
+
     def updateSensorState(self, peak_data):
         if not self.is_running:
             return
 
-        self.statusbar.showMessage('sensor viewer on')
+        draw = self.on_viewer and self.visibility.visible
+        if draw:
+            self.statusbar.showMessage('sensor viewer on')
 
         self.freq = peak_data[0]
         self.peaks = peak_data[1]
@@ -212,57 +242,66 @@ class SensorViewer(QWidget):
         self.target_freq = self.freq[self.target_ids]
 
         if len(self.peaks):
-            self.peak_freq = self.target_freq[self.peaks]
-            self.changeSensorState(self.peak_freq)
-
-        if self.on_viewer:
-            self.timelineGraph.setYRange(
-                self.freq[0], self.freq[-1], padding=0.05)
-            peak = self.target_freq[self.peaks] if len(
-                self.peaks) else np.array([self.freq[0]])
-            self.timeline_y[self.cnt % self.MAX_CNT] = peak
-            self.peak_timeline.setData(self.timeline_x, self.timeline_y)
-            self.peak_scatter_in_timeline.setData([self.timeline_x[self.cnt % self.MAX_CNT]],
-                                                  [self.timeline_y[self.cnt % self.MAX_CNT]])
-            self.peakLabel.setText('{:.2f} MHz'.format(peak[0]))
-
-        self.cnt = self.cnt + 1 if self.cnt < 100000 else 0
+            # sub-bin frequency of the deepest peak and of every peak
+            self.peak_freq = peak_data[3]
+            self.changeSensorState(peak_data[4])
+
+        self.peak = self.peak_freq if len(self.peaks) else self.freq[0]
+        self.peak_timeline.push(self.peak, render=draw)
+        if draw:
+            self._drawTimeline()
+
+    def _drawTimeline(self):
+        self.timeline_y_range.update(self.freq[0], self.freq[-1])
+        self.peakLabel.setText('{:.3f} MHz'.format(self.peak))
+
+    def _showState(self):
+        state = self.states[self.current_sensor]
+        if state != self.shown_states[self.current_sensor]:
+            self.shown_states[self.current_sensor] = state
+            self.status_pic_dict[self.current_sensor].setPixmap(
+                self.PEAK_TABLE[self.current_sensor].img(state))
+            self.status_label_dict[self.current_sensor].setText(
+                '{} sensor: {}'.format(self.current_sensor, state))
+        else:
+            self.suppressed = self.suppressed + 1
+
+    def _catchUp(self):
+        # shown again: draw what was recorded while hidden
+        if not (self.is_running and self.on_viewer):
+            return
+        if self.peak_timeline.count:
+            self.peak_timeline.flush()
+            self._drawTimeline()
+        if self.states is not None:
+            self._showState()
 
     def changeSensorState(self, peaks):
-        ncolumn = self.qt_table_dict[self.current_sensor].columnCount()
-
-        # update table
-        for column in range(ncolumn):
-            freq = self.qt_table_dict[self.current_sensor].item(0, column)
-            if column == ncolumn - 1:
-                self.PEAK_TABLE[self.current_sensor].peak_range = float(
-                    freq.text())
-            else:
-                self.PEAK_TABLE[self.current_sensor].peak_list[column] = float(
-                    freq.text())
-
-        # renew img
-        sensor_info = {}
-        for sensor in SENSOR_LIST:
-            state = self._findState(peaks[0], sensor)
-            sensor_info[sensor] = state
+        # renew img; with several rings every sensor reads its own peak
+        sensor_info = self.classifier.sensor_states(peaks)
+        self.states = sensor_info
 
-        if self.on_viewer:
-            self.status_pic_dict[self.current_sensor].setPixmap(
-                self.PEAK_TABLE[self.current_sensor].img(sensor_info[self.current_sensor]))
-            self.status_pic_dict[self.current_sensor].setScaledContents(True)
-            self.status_label_dict[self.current_sensor].setText(
-                '{} sensor: {}'.format(self.current_sensor, sensor_info[self.current_sensor]))
+        if self.on_viewer and self.visibility.visible:
+            self._showState()
 
-        self.sensor_info_signal.emit(sensor_info)
+        if sensor_info != self.sensor_info:
+            self.sensor_info = sensor_info
+            self.sensor_info_signal.emit(sensor_info)
+        else:
+            self.suppressed = self.suppressed + 1
 
     def startViewer(self, only_update=False):
         self.is_running = True
         self.on_viewer = False if only_update else True
+        # a new listener starts from the current states
+        self.sensor_info = None
         self.startButton.setEnabled(False)
         self.stopButton.setEnabled(True)
 
     def stopViewer(self):
+        if self.is_running and self.suppressed:
+            self.logViewer.appendPlainText(
+                '{} redundant sensor updates suppressed'.format(self.suppressed))
         self.is_running = False
         self.on_viewer = False
         self.startButton.setEnabled(True)
@@ -331,10 +370,4 @@ class SensorViewer(QWidget):
             self.qt_table_dict[self.current_sensor], stretch=3)
 
     def _findState(self, peak, sensor_type):
-        itable = self.PEAK_TABLE[sensor_type]
-        peak_range = itable.peak_range
-        id = findNearestID(array=itable.peak_list, value=peak)
-        state = itable.state_list[id] if (
-            np.abs(itable.peak_list[id] - peak) < peak_range/2) else 'none'
-
-        return state
+        return self.classifier.states(peak)[sensor_type]
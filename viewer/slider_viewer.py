@@ -77,7 +77,6 @@ class SliderViewer(QWidget):
         self.mediaPlayer.setMedia(QMediaContent(
             QUrl.fromLocalFile(QFileInfo('video/test.mp4').absoluteFilePath())))
 
-        self.slider_state_pre = None
 
     def pause(self):
         self.mediaPlayer.pause()
@@ -124,28 +123,19 @@ class SliderViewer(QWidget):
             pos = self.positionSlider.value()
             self.setPosition(pos + 1000)
 
-    def updateVideoState(self, sensor_info):
-        slider_state = sensor_info['slider']
-        self.statusbar.showMessage('slider state: {}'.format(slider_state))
-        if self.slider_state_pre == None:
-            self.slider_state_pre = slider_state
+    def onStateEvent(self, event):
+        if event.sensor != 'slider':
             return
 
-        if slider_state == 'center' and self.slider_state_pre == 'press':
-            self.play()
-            print('test')
-        elif slider_state == 'strong_left':
-            pos = self.positionSlider.value()
-            self.setPosition(pos - 2000)
-        elif slider_state == 'strong_right':
-            pos = self.positionSlider.value()
-            self.setPosition(pos + 2000)
-        elif slider_state == 'weak_left':
-            pos = self.positionSlider.value()
-            self.setPosition(pos - 1000)
-        elif slider_state == 'weak_right':
-            pos = self.positionSlider.value()
-            self.setPosition(pos + 1000)
-
-        self.slider_pic.setPixmap(self.img_dict[slider_state])
-        self.slider_state_pre = slider_state
+        if event.kind == 'transition':
+            self.statusbar.showMessage('slider state: {}'.format(event.state))
+            self.slider_pic.setPixmap(self.img_dict[event.state])
+            if event.state == 'center' and event.previous == 'press':
+                self.play()
+        elif event.kind in ('press', 'hold'):
+            # seek once on press and again every hold_repeat while held
+            step = {'strong_left': -2000, 'weak_left': -1000,
+                    'weak_right': 1000, 'strong_right': 2000}.get(event.state)
+            if step is not None:
+                pos = self.positionSlider.value()
+                self.setPosition(pos + step)
@@ -54,8 +54,7 @@ class SwitchViewer(QWidget):
 
         self.mediaPlayer.setPlaybackRate(1.3)
 
-        self.switch_on_cnt = 0
-        self.pre_switch_state = None
+        self.is_long_press = False
 
     def pause(self):
         self.mediaPlayer.pause()
@@ -101,22 +100,17 @@ class SwitchViewer(QWidget):
         elif event.key() == Qt.Key_R:
             self.setPosition(position=0)
 
-    def updateMusicState(self, sensor_info):
-        switch_state = sensor_info['switch']
-        self.statusbar.showMessage('switch state: {}'.format(switch_state))
-
-        if self.pre_switch_state == None:
-            self.pre_switch_state = switch_state
-            return
-
-        if switch_state == 'on':
-            self.switch_on_cnt = self.switch_on_cnt + 1
+    def onStateEvent(self, event):
+        if event.sensor != 'switch':
             return
 
-        if switch_state == 'off':
-            if self.switch_on_cnt > 30:
-                self.setPosition(position=0)
-            elif self.switch_on_cnt > 2:
+        if event.kind == 'transition':
+            self.statusbar.showMessage('switch state: {}'.format(event.state))
+        elif event.kind == 'long_press' and event.state == 'on':
+            self.is_long_press = True
+            self.setPosition(position=0)
+        elif event.kind == 'release' and event.state == 'on':
+            if not self.is_long_press:
                 self.play()
-            print(self.switch_on_cnt)
-            self.switch_on_cnt = 0
+            self.statusbar.showMessage('switch on for {:.2f} s'.format(event.duration))
+            self.is_long_press = False